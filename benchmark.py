@@ -0,0 +1,202 @@
+"""Repeatable simulation benchmarks.
+
+Each scenario spawns a fleet of one ship type around a player fighter and
+steps it headless for a fixed number of ticks. Every scenario runs in a fresh
+process so that leftovers from one world never slow down the next.
+
+With --sectors CxR the world is split over that many sectors, each run by a
+process of its own (see src/sectors.py). Besides the ticks per second
+actually measured, the results then estimate the ticks per second with a
+core for every sector: the time the sectors spent, taking only the busiest
+one of each exchange.
+
+Usage:
+    python benchmark.py [--ships mini.ship ...] [--sizes 10 100 ...]
+                        [--ticks N] [--sectors CxR] [--output results.json]
+    python benchmark.py --compare old.json new.json
+"""
+import argparse
+import json
+import math
+import subprocess
+import sys
+import time
+
+DEFAULT_SHIPS = ['mini.ship', 'frigate.ship', 'trident.ship', 'asteroid.ship']
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_TICKS = 300
+DEFAULT_WARMUP = 30
+SEED = 1
+# distance between the centres of two ships in a fleet
+FLEET_SPACING = 256
+
+
+def run_scenario(ship, count, ticks, warmup, sectors=None):
+    """Runs a single scenario in this process and returns its results."""
+    import pyglet
+    pyglet.options['shadow_window'] = False
+    from src import settings
+    settings.SOUND = False
+    from pymunk.vec2d import Vec2d
+    from src.space import SPACE
+    from src.debris import DEBRIS
+    from src.replay import seed
+    from src.blueprints import spawn_ship, spawn_fleet
+    from src.simulation import run_headless, SIMULATION, TIMED_SYSTEMS
+    from src.sectors import Universe
+
+    # the workers start out empty, so start them before building the world
+    universe = Universe(*sectors) if sectors else None
+    seed(SEED)
+    # the player gives the AI something to chase and shoot at
+    spawn_ship('fighter.ship', Vec2d(0, 0), player_controlled=True)
+    # lay the fleet out on a square grid, leaving the centre for the player
+    side = int(math.ceil(math.sqrt(count + 1)))
+    cells = [(i, j) for i in range(side) for j in range(side)]
+    cells.remove((side // 2, side // 2))
+    spawn_fleet(ship, [Vec2d(i - side // 2, j - side // 2) * FLEET_SPACING
+                       for i, j in cells[:count]])
+
+    if universe:
+        try:
+            return run_sharded(universe, ship, count, ticks, warmup)
+        finally:
+            universe.close()
+
+    run_headless(warmup)
+    timings = {}
+    elapsed = run_headless(ticks, timings)
+
+    return {
+        'ship': ship,
+        'count': count,
+        'ticks': ticks,
+        'blocks': len(SPACE.blocks),
+        'bodies': len(SPACE.bodies),
+        'constraints': len(SPACE.constraints),
+        'debris': DEBRIS.counts(),
+        'ticks_per_second': ticks / elapsed,
+        'ms_per_tick': dict((name, timings[name] / ticks * 1000)
+                            for name in TIMED_SYSTEMS),
+        # runs over budget, warmup included
+        'overruns': dict((s.name, s.overruns)
+                         for s in SIMULATION.scheduler.systems),
+    }
+
+
+def run_sharded(universe, ship, count, ticks, warmup):
+    from src.simulation import TIMED_SYSTEMS
+
+    universe.distribute()
+    universe.run(warmup)
+    universe.busy = universe.busiest = 0.0
+    timings = dict((name, 0.0) for name in TIMED_SYSTEMS)
+    elapsed = universe.run(ticks, timings)
+    totals = universe.totals()
+    # with a core each, the sectors would only have waited for the busiest
+    parallel = elapsed - universe.busy + universe.busiest
+
+    return {
+        'ship': ship,
+        'count': count,
+        'ticks': ticks,
+        'sectors': len(universe.workers),
+        'blocks': totals['blocks'],
+        'bodies': totals['bodies'],
+        'constraints': 0,
+        'debris': dict((name, totals[name])
+                       for name in ('debris', 'salvaged', 'despawned')),
+        'ticks_per_second': ticks / elapsed,
+        'parallel_ticks_per_second': ticks / parallel,
+        # summed over all sectors
+        'ms_per_tick': dict((name, timings[name] / ticks * 1000)
+                            for name in TIMED_SYSTEMS),
+        'overruns': {},
+    }
+
+
+def run_all(ships, sizes, ticks, warmup, sectors=None):
+    results = []
+    for ship in ships:
+        for count in sizes:
+            cmd = [sys.executable, __file__, '--scenario', ship, str(count),
+                   '--ticks', str(ticks), '--warmup', str(warmup)]
+            if sectors:
+                cmd += ['--sectors', 'x'.join(map(str, sectors))]
+            output = subprocess.check_output(cmd)
+            # chipmunk may print its own chatter, our result is the json line
+            line = [l for l in output.splitlines() if l.startswith('{')][-1]
+            result = json.loads(line)
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(r):
+    ms = r['ms_per_tick']
+    print("{:<14} {:>5} ships {:>6} blocks {:>8.1f} ticks/s | "
+          "update {:.3f}  step {:.3f}  ai {:.3f}  power {:.3f}  "
+          "lod {:.3f} ms".format(
+              r['ship'], r['count'], r['blocks'], r['ticks_per_second'],
+              ms['update'], ms['step'], ms['tick_ai'], ms['tick_power'],
+              ms.get('tick_lod', 0)))
+    if 'sectors' in r:
+        print("{:>21} sectors {:>15.1f} ticks/s with a core each".format(
+            r['sectors'], r['parallel_ticks_per_second']))
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_results = dict(((r['ship'], r['count']), r) for r in old['results'])
+    print("{:<14} {:>5} {:>10} {:>10} {:>8}".format(
+        'ship', 'count', 'old tps', 'new tps', 'change'))
+    for r in new['results']:
+        o = old_results.get((r['ship'], r['count']))
+        if o is None:
+            continue
+        change = r['ticks_per_second'] / o['ticks_per_second'] - 1
+        print("{:<14} {:>5} {:>10.1f} {:>10.1f} {:>+7.1f}%".format(
+            r['ship'], r['count'], o['ticks_per_second'],
+            r['ticks_per_second'], change * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ships', nargs='+', default=DEFAULT_SHIPS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--ticks', type=int, default=DEFAULT_TICKS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--sectors', default=None, metavar='CxR',
+                        help="split the world over C by R sectors")
+    parser.add_argument('--output', default=None,
+                        help="where to save the results (default: "
+                             "bench-<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--scenario', nargs=2, metavar=('SHIP', 'COUNT'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sectors = args.sectors and [int(n) for n in args.sectors.split('x')]
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.scenario:
+        ship, count = args.scenario
+        result = run_scenario(ship, int(count), args.ticks, args.warmup,
+                              sectors)
+        sys.stdout.write(json.dumps(result) + '\n')
+    else:
+        results = run_all(args.ships, args.sizes, args.ticks, args.warmup,
+                          sectors)
+        output = args.output or time.strftime('bench-%Y%m%d-%H%M%S.json')
+        with open(output, 'w') as f:
+            json.dump({'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'ticks': args.ticks,
+                       'results': results}, f, indent=4)
+        print("Saved results to " + output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Runs the simulation without a window, GL context or audio.
+
+Usage:
+    python headless.py [ticks] [profile] [load=FILE] [save=FILE]
+    python headless.py replay=FILE [profile] [save=FILE]
+    python headless.py [ticks] [load=FILE] sectors=CxR
+
+load= starts from a snapshot instead of the default world, and save= writes
+one once the ticks have run (see src/snapshot.py). replay= plays back a
+session recorded with `python main.py record=FILE` instead, for as many
+ticks as it ran, and tells whether it came out the same (see src/replay.py).
+sectors= splits the world over a grid of C by R sectors, each run by a
+process of its own (see src/sectors.py).
+"""
+# No window means no GL context, so make sure pyglet never creates one
+import sys
+import pyglet
+pyglet.options['shadow_window'] = False
+from src import settings
+settings.SOUND = False
+
+# The rest of the imports
+from src.space import SPACE
+from src.debris import DEBRIS
+from src import snapshot
+from src.replay import Recording
+from src.sectors import Universe
+from src.simulation import (populate_world, run_headless, SIMULATION,
+                            UPDATE_RATE, TIMED_SYSTEMS)
+
+DEFAULT_TICKS = 60 * 60
+
+
+def main():
+    ticks = DEFAULT_TICKS
+    load = save = replay = sectors = None
+    for arg in sys.argv[1:]:
+        if arg.isdigit():
+            ticks = int(arg)
+        elif arg.startswith('load='):
+            load = arg[len('load='):]
+        elif arg.startswith('save='):
+            save = arg[len('save='):]
+        elif arg.startswith('replay='):
+            replay = arg[len('replay='):]
+        elif arg.startswith('sectors='):
+            sectors = [int(n) for n in arg[len('sectors='):].split('x')]
+    if sectors and (save or replay):
+        sys.exit("sectors= cannot be used with save= or replay=")
+
+    timings = {}
+    if sectors:
+        return run_sectors(ticks, load, sectors, timings)
+    if replay:
+        recording = Recording.load(replay)
+        ticks = recording.ticks
+        elapsed, same = recording.replay(timings)
+    else:
+        if load:
+            snapshot.load(load)
+        else:
+            populate_world()
+        elapsed = run_headless(ticks, timings)
+
+    print("{} ticks of {:.4f}s in {:.2f}s ({:.1f} ticks/s, {} blocks)".format(
+        ticks, UPDATE_RATE, elapsed, ticks / elapsed, len(SPACE.blocks)))
+    print("{debris} pieces of debris, {salvaged} salvaged and {despawned} "
+          "despawned".format(**DEBRIS.counts()))
+    print(", ".join("{} {:.3f} ms".format(name, timings[name] * 1000 / max(ticks, 1))
+                    for name in TIMED_SYSTEMS) + " per tick")
+    if replay:
+        print("replay {} the recording".format(
+            "matches" if same else "DIFFERS from"))
+    if save:
+        snapshot.save(save)
+    overruns = SIMULATION.scheduler.report()
+    if overruns:
+        print(overruns)
+
+
+def run_sectors(ticks, load, sectors, timings):
+    # the workers start out empty, so start them before building the world
+    universe = Universe(*sectors)
+    try:
+        if load:
+            snapshot.load(load)
+        else:
+            populate_world()
+        universe.distribute()
+        elapsed = universe.run(ticks, timings)
+        totals = universe.totals()
+    finally:
+        universe.close()
+
+    print("{} ticks of {:.4f}s in {:.2f}s ({:.1f} ticks/s, {} blocks in {} "
+          "sectors)".format(ticks, UPDATE_RATE, elapsed, ticks / elapsed,
+                            totals['blocks'], len(universe.counts)))
+    # with a core each, the sectors would only have waited for the busiest
+    parallel = elapsed - universe.busy + universe.busiest
+    print("{:.1f} ticks/s with a core per sector".format(ticks / parallel))
+    print("{debris} pieces of debris, {salvaged} salvaged and {despawned} "
+          "despawned".format(**totals))
+    for key in sorted(universe.counts):
+        print("sector {}: {blocks} blocks, {ghosts} ghosts".format(
+            key, **universe.counts[key]))
+    # added up over the sectors, which may have been sharing cores
+    print(", ".join("{} {:.3f} ms".format(name, timings[name] * 1000 / max(ticks, 1))
+                    for name in TIMED_SYSTEMS) + " per tick, all sectors")
+
+if __name__ == '__main__':
+    if 'profile' in sys.argv:
+        import cProfile, pstats
+        cProfile.run('main()', 'nihil_ace_headless.prof')
+        p = pstats.Stats('nihil_ace_headless.prof')
+        p.strip_dirs().sort_stats('time').print_stats(20)
+    else:
+        main()
@@ -0,0 +1,70 @@
+"""Enemy AI, worked out for many cockpits at once.
+
+Every AI cockpit does the same thing: raise its shields, turn towards the
+player and shoot when the player is close and in front of it. The angles and
+distances for all of the cockpits thinking this tick are computed together
+with numpy, and a cockpit only presses or releases keys when its decision
+changes. Cockpits far from the player think less often.
+"""
+import math
+import numpy as np
+from space import SPACE
+from materials import BLOCK_SIZE
+import settings
+
+FIRING_RANGE = BLOCK_SIZE * 50
+# how far off the nose the player can be and still get shot at
+FIRING_ARC = math.pi / 8
+
+
+def think(cockpits):
+    target = SPACE.camera_lock and SPACE.camera_lock()
+    if not target or target.destroyed: # they win and quit moving
+        [c.stop() for c in cockpits]
+        return
+
+    due = []
+    for c in cockpits:
+        if c._ai_wait:
+            c._ai_wait -= 1
+        else:
+            due.append(c)
+    if not due:
+        return
+
+    # read each body and the cockpit's place on it
+    rows = []
+    for c in due:
+        body = c._shape.body
+        x, y = body.position
+        ox, oy = c._offset
+        rows.append((x, y, body.angle, body.angular_velocity, ox, oy,
+                     c._local_angle))
+    state = np.array(rows, dtype=np.float64)
+    body_angle, spin = state[:, 2], state[:, 3]
+    cos, sin = np.cos(body_angle), np.sin(body_angle)
+    x = state[:, 0] + state[:, 4] * cos - state[:, 5] * sin
+    y = state[:, 1] + state[:, 4] * sin + state[:, 5] * cos
+    angle = body_angle + state[:, 6]
+
+    tx, ty = target._body.position
+    dx, dy = tx - x, ty - y
+    distance = np.hypot(dx, dy)
+    # 0 when the nose points straight at the target
+    off = np.mod(angle - np.arctan2(dy, dx) + math.pi / 2, math.pi * 2)
+    ahead = off < FIRING_ARC
+    # where the nose will be pointing next, the shortest way round
+    off += spin
+    clockwise = (((off > 0) & (np.abs(off) > math.pi)) |
+                 ((off < 0) & (np.abs(off) <= math.pi)))
+    # spinning too fast wins over aiming: turn against the spin
+    left = (spin < -math.pi / 2) | ((spin <= math.pi / 2) & clockwise)
+    fire = (distance <= FIRING_RANGE) & ahead
+    far = distance > settings.AI_NEAR_RADIUS
+    wait = settings.AI_FAR_INTERVAL - 1
+
+    for c, l, f, r in zip(due, left.tolist(), fire.tolist(), far.tolist()):
+        c.raise_shields()
+        c.steer(l)
+        c.fire(f)
+        c._ai_wait = wait if r else 0
@@ -0,0 +1,172 @@
+"""Packs the block sprites and the small effect sprites into one texture atlas
+so that a whole frame of blocks can be drawn with a single texture bound.
+
+Packing only happens when a sprite changed since the last build; the packed
+image and its table of texture coordinates are cached on disk. Run this file
+directly to rebuild the cache:
+
+    python src/atlas.py
+"""
+import glob
+import json
+import os
+import numpy as np
+import pyglet
+
+EFFECT_IMAGES = ['images/fire.png',
+                 'images/blast.png',
+                 'images/iron.png',
+                 'images/shield_bubble.png',
+                 'images/arrow.png',
+]
+
+CACHE_DIR = 'cache'
+CACHE_IMAGE = os.path.join(CACHE_DIR, 'atlas.png')
+CACHE_TABLE = os.path.join(CACHE_DIR, 'atlas.json')
+
+# Every sprite is surrounded by copies of its own edge pixels so that neither
+# filtering nor the smaller mipmap levels bleed neighbouring sprites into it.
+PADDING = 4
+
+# Texture coordinates of the four corners of a quad, as fractions of a
+# sprite, for each of the four directions it can face. renderer.draw_rect
+# turns textures with these too.
+CORNERS = np.array([[((i + d) % 4 // 2, ((i + d) % 4 + 1) // 2 % 2)
+                     for i in range(4)]
+                    for d in range(4)], dtype=np.float32)
+
+
+def atlas_sources():
+    return sorted(glob.glob('images/blocks/*.png')) + EFFECT_IMAGES
+
+
+def block_image_path(image, state=''):
+    """The filename of a block's sprite, `state` being '', '_damaged' or
+    '_destroyed'.
+    """
+    return "images/blocks/{}{}.png".format(image, state)
+
+
+def _load_pixels(filename):
+    img = pyglet.image.load(filename)
+    data = img.get_data('RGBA', img.width * 4)
+    return np.frombuffer(data, dtype=np.uint8).reshape(img.height,
+                                                       img.width, 4)
+
+
+def pack(sources):
+    """Shelf packs the sprites, tallest first, into the smallest power of two
+    square that fits them. Rows are stored bottom up like pyglet images.
+    Returns the pixels and a dict of filename: (u0, v0, u1, v1).
+    """
+    sprites = [(f, _load_pixels(f)) for f in sources]
+    sprites.sort(key=lambda s: (-s[1].shape[0], s[0]))
+
+    size = 64
+    while True:
+        placements = {}
+        x = y = shelf = 0
+        for filename, pixels in sprites:
+            h, w = pixels.shape[0] + PADDING * 2, pixels.shape[1] + PADDING * 2
+            if x + w > size:
+                x, y, shelf = 0, y + shelf, 0
+            placements[filename] = (x, y)
+            x += w
+            shelf = max(shelf, h)
+        if y + shelf <= size:
+            break
+        size *= 2
+
+    atlas = np.zeros((size, size, 4), dtype=np.uint8)
+    regions = {}
+    for filename, pixels in sprites:
+        h, w = pixels.shape[:2]
+        x, y = placements[filename]
+        padded = np.pad(pixels, ((PADDING, PADDING), (PADDING, PADDING),
+                                 (0, 0)), mode='edge')
+        atlas[y:y + h + PADDING * 2, x:x + w + PADDING * 2] = padded
+        x, y = x + PADDING, y + PADDING
+        regions[filename] = (float(x) / size, float(y) / size,
+                             float(x + w) / size, float(y + h) / size)
+    return atlas, regions
+
+
+def _source_times(sources):
+    return dict((f, os.path.getmtime(f)) for f in sources)
+
+
+def build(sources=None):
+    """Packs the atlas and writes it and its table to the cache."""
+    sources = sources or atlas_sources()
+    pixels, regions = pack(sources)
+    if not os.path.isdir(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    h, w = pixels.shape[:2]
+    image = pyglet.image.ImageData(w, h, 'RGBA', pixels.tostring(),
+                                   pitch=w * 4)
+    image.save(CACHE_IMAGE)
+    with open(CACHE_TABLE, 'w') as f:
+        json.dump({'sources': _source_times(sources),
+                   'regions': regions}, f, indent=4, sort_keys=True)
+    return regions
+
+
+def load_regions():
+    """Reads the table of texture coordinates from the cache, packing the
+    atlas again first if any sprite was added or changed since.
+    """
+    sources = atlas_sources()
+    try:
+        with open(CACHE_TABLE) as f:
+            table = json.load(f)
+        if (table['sources'] == _source_times(sources)
+                and os.path.exists(CACHE_IMAGE)):
+            return table['regions']
+    except (IOError, ValueError, KeyError):
+        pass
+    return build(sources)
+
+
+class Atlas(object):
+    """Looks up where a sprite lives in the atlas.
+
+    Every sprite gets a slot number so that bulk renderers can keep arrays of
+    slots and turn them into texture coordinates with a single lookup into
+    `tex_coords`, which has shape (slots, 4 directions, 4 corners, 2).
+    """
+
+    def __init__(self, regions):
+        self.filenames = sorted(regions)
+        self.slots = dict((f, i) for i, f in enumerate(self.filenames))
+        self.tex_coords = np.zeros((len(self.filenames), 4, 4, 2),
+                                   dtype=np.float32)
+        for f, (u0, v0, u1, v1) in regions.items():
+            slot = self.tex_coords[self.slots[f]]
+            slot[:, :, 0] = u0 + CORNERS[:, :, 0] * (u1 - u0)
+            slot[:, :, 1] = v0 + CORNERS[:, :, 1] * (v1 - v0)
+        self._texture = None
+
+    @property
+    def texture(self):
+        """The atlas texture, uploaded the first time it is needed."""
+        if self._texture is None:
+            self._texture = pyglet.image.load(CACHE_IMAGE).mipmapped_texture
+        return self._texture
+
+    def quad(self, filename, direction=0):
+        """Texture coordinates for the four corners of a quad."""
+        return self.tex_coords[self.slots[filename], direction]
+
+
+_atlas = None
+
+
+def get_atlas():
+    global _atlas
+    if _atlas is None:
+        _atlas = Atlas(load_regions())
+    return _atlas
+
+if __name__ == '__main__':
+    regions = build()
+    print("Packed {} sprites into {}".format(len(regions), CACHE_IMAGE))
@@ -1,33 +1,24 @@
 import math
-import pyglet
 import pymunk
-from renderer import adjust_for_cam, off_screen, draw_rect, draw_large_point
+from renderer import off_screen, draw_rect, load_image, EFFECTS
 from space import SPACE
-from materials import Material, COLLISION_TYPES
+from materials import Material, COLLISION_TYPES, BLOCK_SIZE, BLOCK_CORNERS
 from pyglet.window import key
-from pymunk import PivotJoint, GearJoint
 from pymunk.vec2d import Vec2d
 from weakref import ref, WeakSet
-from explosion import Explosion
-from projectiles import Projectile
-from resources import Resource
-from pyglet.sprite import Sprite
+from atlas import block_image_path
+from construction import Construction, BlockBody
+from blockstate import BLOCK_STATE, stored, in_order
+from power import mark_dirty
+from explosion import explode
+from projectiles import PROJECTILES
+from resources import RESOURCES
+from debris import DEBRIS
+from sensors import SENSORS
+from shapes import hull_shape, shield_shape
 import random
 
-BLOCK_SIZE = 16
-
-CACHED_IMAGES = {}
-
-
-def load_image(filename, anchor=Vec2d(0, 0)):
-    if filename in CACHED_IMAGES:
-        return CACHED_IMAGES[filename]
-    else:
-        img = pyglet.image.load(filename)
-        img.anchor_x, img.anchor_y = int(anchor.x), int(anchor.y)
-        CACHED_IMAGES[filename] = img.mipmapped_texture
-        return CACHED_IMAGES[filename]
-
+CORNER_TUPLES = [tuple(c) for c in BLOCK_CORNERS]
 
 class ConstructionBlock():
     """THIS REALLY ISN'T A BLOCK!
@@ -39,9 +30,6 @@ class ConstructionBlock():
     image_anchor = Vec2d(BLOCK_SIZE / 2, BLOCK_SIZE / 2)
 
     def __init__(self):
-        # load images
-        base_path = "images/blocks/{}.png".format(self.image)
-        self.img = load_image(base_path, self.image_anchor)
         # create collision object
         w = h = BLOCK_SIZE
         inertia = pymunk.moment_for_box(1, w, h)
@@ -51,229 +39,305 @@ class ConstructionBlock():
         self._shape.collision_type = COLLISION_TYPES['ghost']
         self._shape.sensor = True
         self._shape._get_block = ref(self)
-        SPACE.add(self._body, self._shape)
+        # it is only drawn, so it stays out of the space and the simulation
+        # runs the same with or without it
+
         # what can it connect to?
         self.valid_welds = []
 
+    @property
+    def img(self):
+        return load_image(block_image_path(self.image), self.image_anchor)
+
     def draw(self):
         draw_rect(self.img.id, self._shape.get_vertices(),
                   direction=self.direction)
 
 
 class Block(object):
+    """A handle on one block. Its state lives in BLOCK_STATE, in the row
+    given by `id`; see blockstate.
+    """
+    __slots__ = ('id', '_generation', '_adjacent_blocks', '_body', '_shape',
+                 '_offset', '_local_angle', '_construction', '__weakref__')
     # TODO: let's make blocks that can be more than a single fixed size
     material = Material()
     bindings = []
-    direction = 0  # 0-3 for the cardinal directions
     health = 3
-    damage = 0
-    has_exploded = False
+    # the registries in SPACE, besides SPACE.blocks, that list this block
+    space_indexes = ()
 
     # sprites
     image = 'basic'
     # TODO: calculate this based on individual block size
     image_anchor = Vec2d(BLOCK_SIZE / 2, BLOCK_SIZE / 2)
 
-    def __init__(self, point):
-        self._joints = WeakSet()
-        self._adjacent_blocks = WeakSet()
-        # load images
-        base_path = "images/blocks/{}.png".format(self.image)
-        damaged_path = "images/blocks/{}_damaged.png".format(self.image)
-        destroyed_path = "images/blocks/{}_destroyed.png".format(self.image)
-        self.img = load_image(base_path, self.image_anchor)
-        self.img_damaged = load_image(damaged_path, self.image_anchor)
-        self.img_destroyed = load_image(destroyed_path, self.image_anchor)
+    direction = stored('direction', "0-3 for the cardinal directions")
+    damage = stored('damage')
+    has_exploded = stored('exploded')
+
+    @property
+    def destroyed(self):
+        return not BLOCK_STATE.holds(self.id, self._generation)
+
+    def __init__(self, point, body=None, angle=0):
+        """Makes a block on its own body at `point`.
+
+        Given a `body`, `point` is instead the block's offset on that body
+        and `angle` its angle there, and adding its shape to the space and
+        putting it in a construction are left to the caller, which is how
+        blueprints build a whole ship at once.
+        """
+        self.id, self._generation = BLOCK_STATE.new(self)
+        self._shape = None
+        # the blocks this one is welded to
+        self._adjacent_blocks = []
+        self._body = BlockBody(self)
+        SPACE.register_block(self)
+        if body is not None:
+            self._attach(body, point, angle)
+            return
 
         w = h = BLOCK_SIZE
         # using (density * 1 ** 2) for these because our units are BLOCK_SIZE
         inertia = pymunk.moment_for_box(self.material.density, w, h)
-        self._body = pymunk.Body(self.material.density, inertia)
-        self._body.position = point
-        self._shape = pymunk.Poly.create_box(self._body, (w, h))
+        body = pymunk.Body(self.material.density, inertia)
+        body.position = point
+        SPACE.add(body, *self._attach(body, Vec2d(0, 0), 0))
+        Construction([self], body)
+
+    def _attach(self, body, offset, angle):
+        """Moves the block onto `body`, centred on `offset` and turned by
+        `angle` in the body's coordinates. Returns the new shapes for the
+        caller to add to the space.
+        """
+        if self._shape is not None:
+            SPACE.remove(self._shape)
+        self._offset = Vec2d(offset)
+        self._local_angle = angle
+        self._shape = hull_shape(self.id, body, self._corners())
         self._shape.elasticity = self.material.elasticity
         self._shape.friction = self.material.friction
         self._shape.collision_type = self.material.collision_type
         self._shape._get_block = ref(self)
-        SPACE.add(self._body, self._shape)
-        SPACE.register_block(self)
+        return [self._shape]
+
+    def _corners(self):
+        """The corners of the block's shape in the body's coordinates."""
+        x, y = self._offset
+        cos, sin = math.cos(self._local_angle), math.sin(self._local_angle)
+        return [(x + cx * cos - cy * sin, y + cx * sin + cy * cos)
+                for cx, cy in CORNER_TUPLES]
+
+    def _shift(self, centre):
+        """Keeps the block where it is while its body's centre moves to
+        `centre`, in the body's coordinates.
+        """
+        self._offset = self._offset - centre
+        self._shape.unsafe_set_vertices(self._corners())
 
     def weld_to(self, block):
-        pj = PivotJoint(self._body, block._body,
-                              (self._body.position + block._body.position) / 2)
-        gj = GearJoint(self._body, block._body, 0, 1)
-        SPACE.add(pj, gj)
-        # add weak references to each other
-        block._adjacent_blocks.add(self)
-        self._adjacent_blocks.add(block)
-        # and to the joint
-        self._joints.add(pj)
-        block._joints.add(pj)
-        self._joints.add(gj)
-        block._joints.add(gj)
+        if block not in self._adjacent_blocks:
+            block._adjacent_blocks.append(self)
+            self._adjacent_blocks.append(block)
+        # and become part of the same construction (and body)
+        self._construction.merge(block._construction)
 
-    def draw(self):
-        if off_screen(self._body.position):
-            return
+    @property
+    def texture(self):
+        """The filename of the sprite for the block's current state."""
         if self.damage >= self.health:
-            tex = self.img_destroyed.id
+            return block_image_path(self.image, '_destroyed')
         elif self.damage > 0:
-            tex = self.img_damaged.id
-        else:
-            tex = self.img.id
-        draw_rect(tex, self._shape.get_vertices(), direction=self.direction)
-
-    def take_physics_damage(self):
-        for joint in self._joints.copy():
-            self.take_damage(joint.impulse // 250)
+            return block_image_path(self.image, '_damaged')
+        return block_image_path(self.image)
 
     def take_damage(self, amount):
         self.damage += amount
         if self.damage >= self.health and not self.has_exploded:
             # create an explosion
             self.has_exploded = True
-            Explosion(self._body.position, BLOCK_SIZE,
-                      velocity=self._body.velocity)
-            # remove joints
-            for block in self._adjacent_blocks:
-                toremove = self._joints & block._joints
-                for joint in toremove:
-                    block._joints.remove(joint)
-            SPACE.remove(*self._joints)
-            self._joints = WeakSet()
+            explode(self._body.position, BLOCK_SIZE,
+                    velocity=self._body.velocity)
             # remove ties to the construction
-            for block in self._adjacent_blocks:
+            neighbours = list(self._adjacent_blocks)
+            for block in neighbours:
                 block._adjacent_blocks.remove(self)
-            self._adjacent_blocks = WeakSet()
-        elif self.damage >= self.health * 2:
-            Explosion(self._body.position, BLOCK_SIZE,
-                      velocity=self._body.velocity)
+            self._adjacent_blocks = []
+            self._construction.detach(self, neighbours)
+            DEBRIS.add(self)
+        elif self.damage >= self.health * 2 and not self.destroyed:
+            explode(self._body.position, BLOCK_SIZE,
+                    velocity=self._body.velocity)
             for i in range(random.randint(1,5)):
-                Resource(self)
-            SPACE.remove(self._body, self._shape)
-            SPACE.blocks.remove(self)
-            if self in SPACE.controllable_blocks:
-                SPACE.controllable_blocks.remove(self)
-            if self in SPACE.controller_blocks:
-                SPACE.controller_blocks.remove(self)
+                RESOURCES.spawn(self)
+            self.remove()
+
+    def remove(self):
+        """Takes the block, which must be on its own, out of the world for
+        good.
+        """
+        self._forget()
+        SPACE.remove(self._shape.body)
+        self._construction.body = None
+        self._construction.discard(self)
+
+    def _forget(self):
+        """Everything remove() does but taking the body away; see also
+        Construction.remove().
+        """
+        if getattr(self, '_active', False):
+            self.deactivate()
+            self._active = False
+        BLOCK_STATE.destroy(self.id)
+        SPACE.remove(self._shape)
+        SPACE.unregister_block(self)
+        DEBRIS.discard(self)
 
     @property
     def construction(self):
-        c = WeakSet()
-        c.add(self)
-        self._build_construction(c)
-        return c
-
-    def _build_construction(self, current_set):
-        for block in self._adjacent_blocks:
-            if block not in current_set:
-                current_set.add(block)
-                block._build_construction(current_set)
+        return self._construction
 
 
 class AngleLeftBlock(Block):
+    __slots__ = ()
     image = 'angle_left'
 
 
 class AngleRightBlock(Block):
+    __slots__ = ()
     image = 'angle_right'
 
 
 class FinLeftBlock(Block):
+    __slots__ = ()
     image = 'fin_left'
 
 
 class FinRightBlock(Block):
+    __slots__ = ()
     image = 'fin_right'
 
 
 class ArmorBlock(Block):
+    __slots__ = ()
     health = 6
     image = 'armor'
 
 
 class ReactorBlock(Block):
+    __slots__ = ('big_explosion',)
+    space_indexes = ('reactors',)
     power_generated = 3
-    power_used = 0
+    power_used = stored('power_used')
     image = 'reactor'
-    big_explosion = False
+
+    def __init__(self, point, body=None, angle=0):
+        self.big_explosion = False
+        super(ReactorBlock, self).__init__(point, body, angle)
 
     def take_damage(self, amount):
         super(ReactorBlock, self).take_damage(amount)
         if self.damage >= self.health and not self.big_explosion:
             self.big_explosion = True
-            Explosion(self._body.position, BLOCK_SIZE * 1.5,
-                      velocity=self._body.velocity, damage=2)
+            explode(self._body.position, BLOCK_SIZE * 1.5,
+                    velocity=self._body.velocity, damage=2)
 
 
 class CockpitBlock(Block):
+    __slots__ = ('ai', '_ai_wait', 'slave_blocks', 'shieldsup',
+                 '_turning_left', '_firing', 'left_blocks', 'right_blocks',
+                 'blasters', 'shields')
+    space_indexes = ('cockpits',)
     image = 'cockpit'
-    ai = True
 
-    def __init__(self, point):
-        super(CockpitBlock, self).__init__(point)
+    def __init__(self, point, body=None, angle=0):
+        super(CockpitBlock, self).__init__(point, body, angle)
+        self.ai = True
+        self._ai_wait = 0 # AI passes to skip before thinking again, see ai
         self.slave_blocks = WeakSet()
         self.shieldsup = False
+        self._turning_left = None
+        self._firing = None
+        self.update_controls()
+
+    def update_controls(self):
+        """Sorts the slave blocks into the groups the AI works with. Call it
+        again whenever slave_blocks changes.
+        """
+        self.left_blocks = WeakSet(b for b in self.slave_blocks
+                                   if b.key == key.LEFT)
+        self.right_blocks = WeakSet(b for b in self.slave_blocks
+                                    if b.key == key.RIGHT)
+        self.blasters = WeakSet(b for b in self.slave_blocks
+                                if isinstance(b, BlasterBlock))
+        self.shields = WeakSet(b for b in self.slave_blocks
+                               if isinstance(b, ShieldBlock))
+
+    # Slave blocks are always pressed in the order they were made, so that
+    # their power grids are solved in the same order every run.
 
     def on_key_press(self, key):
-        [b.on_key_down() for b in self.slave_blocks if b.key == key]
+        [b.on_key_down() for b in in_order(self.slave_blocks) if b.key == key]
 
     def on_key_release(self, key):
-        [b.on_key_up() for b in self.slave_blocks if b.key == key]
+        [b.on_key_up() for b in in_order(self.slave_blocks) if b.key == key]
+
+    # The AI's controls. They only touch the keys when the decision changes.
 
-    def enemy_ai_update(self):
-        # TODO: This is pretty stupid AI. We'll have to work on that later.
-        # ALWAYS TURN ON SHIELDS
+    def raise_shields(self):
         if not self.shieldsup:
-            [b.on_key_down() for b in self.slave_blocks if isinstance(b, ShieldBlock)]
+            [b.on_key_down() for b in in_order(self.shields)]
             self.shieldsup = True
 
-        # ALWAYS FLY TOWARDS PLAYER
-        if not SPACE.camera_lock(): # they win and quit moving
-            [b.on_key_up() for b in self.slave_blocks]
-            return
-        target = SPACE.camera_lock # this is naive, but works for now
-        target_dir = target()._body.position - self._body.position
-        ang = (self._body.angle - target_dir.angle + math.pi / 2) % (math.pi * 2)
-        general_direction = abs((ang) % (math.pi * 2)) < math.pi / 8
-        ang += self._body.angular_velocity
-        if ang > 0 and abs(ang) <= math.pi:
-            best_direction = "ccw"
-        elif ang > 0 and abs(ang) > math.pi:
-            best_direction = "cw"
-        elif ang < 0 and abs(ang) <= math.pi:
-            best_direction = "cw"
-        elif ang < 0 and abs(ang) > math.pi:
-            best_direction = "ccw"
-        if self._body.angular_velocity > math.pi / 2:
-            [b.on_key_up() for b in self.slave_blocks if b.key == key.LEFT]
-            [b.on_key_down() for b in self.slave_blocks if b.key == key.RIGHT]
-        elif self._body.angular_velocity < -math.pi / 2:
-            [b.on_key_up() for b in self.slave_blocks if b.key == key.RIGHT]
-            [b.on_key_down() for b in self.slave_blocks if b.key == key.LEFT]
-        # TODO: If moving very fast relative to the target, slow down
-        elif best_direction == "cw":
-            [b.on_key_up() for b in self.slave_blocks if b.key == key.RIGHT]
-            [b.on_key_down() for b in self.slave_blocks if b.key == key.LEFT]
-        else:
-            [b.on_key_up() for b in self.slave_blocks if b.key == key.LEFT]
-            [b.on_key_down() for b in self.slave_blocks if b.key == key.RIGHT]
-
-        # SHOOT AT PLAYER IF CLOSE
-        ang = self._body.angle - target_dir.angle + math.pi / 2
-        if (target_dir.length <= BLOCK_SIZE * 50 and general_direction):
-            [b.on_key_down() for b in self.slave_blocks if isinstance(b, BlasterBlock)]
-        else:
-            [b.on_key_up() for b in self.slave_blocks if isinstance(b, BlasterBlock)]
+    def steer(self, left):
+        if left != self._turning_left:
+            self._turning_left = left
+            if left:
+                up, down = self.right_blocks, self.left_blocks
+            else:
+                up, down = self.left_blocks, self.right_blocks
+            [b.on_key_up() for b in in_order(up)]
+            [b.on_key_down() for b in in_order(down)]
+
+    def fire(self, firing):
+        if firing != self._firing:
+            self._firing = firing
+            if firing:
+                [b.on_key_down() for b in in_order(self.blasters)]
+            else:
+                [b.on_key_up() for b in in_order(self.blasters)]
+
+    def stop(self):
+        """Lets go of every key."""
+        if self._turning_left is not None or self._firing:
+            [b.on_key_up() for b in in_order(self.slave_blocks)]
+            self._turning_left = self._firing = None
 
 
 class ControllableBlock(Block):
+    __slots__ = ('key', 'binding_type')
+    space_indexes = ('controllable_blocks',)
     power_requirement = 1
-    key = None
-    binding_type = "toggle" # also use "mirror" or "inverted"
-    _active = False # True if it is currently running
-    on = False # True if the "switch" is on. It *may* actually be active.
-    powered = False
+    power_priority = stored('priority', "higher priorities are powered first")
+    _active = stored('active', "True if it is currently running")
+    powered = stored('powered')
+
+    def __init__(self, point, body=None, angle=0):
+        self.key = None
+        self.binding_type = "toggle" # also use "mirror" or "inverted"
+        super(ControllableBlock, self).__init__(point, body, angle)
+
+    @property
+    def on(self):
+        """True if the "switch" is on. It *may* actually be active."""
+        return BLOCK_STATE.on.item(self.id)
+
+    @on.setter
+    def on(self, value):
+        if value != self.on:
+            BLOCK_STATE.on[self.id] = value
+            mark_dirty(self._construction)
 
     def on_key_down(self):
         if self.binding_type == "toggle":
@@ -292,25 +356,10 @@ class ControllableBlock(Block):
             self.on = True
 
     def _upkeep(self):
-        if self.powered and self.on and not self._active:
-            self.activate()
-            self._active = True
-        elif not (self.on and self.powered) and self._active:
-            self.deactivate()
-            self._active = False
-
-    def _power_upkeep(self):
-        if not self.on:
-            return True
-        self.powered = False
-        c = self.construction
-        power_blocks = [b for b in c if isinstance(b, ReactorBlock)]
-        for b in power_blocks:
-            if b.power_used + self.power_requirement <= b.power_generated:
-                b.power_used += self.power_requirement
-                self.powered = True
-                return True # successfully powered
-        return False # no more power
+        """Runs every tick while the block is active. Switching blocks on and
+        off is done for all of them at once, see BLOCK_STATE.switching().
+        """
+        pass
 
     def activate(self):
         pass
@@ -318,139 +367,172 @@ class ControllableBlock(Block):
     def deactivate(self):
         pass
 
+    def draw_effects(self):
+        """Adds anything drawn on top of the block while it is active to
+        renderer.EFFECTS. The block itself is drawn by renderer.BLOCKS.
+        """
+        pass
+
 
 class BlasterBlock(ControllableBlock):
+    __slots__ = ()
     image = 'blaster'
 
-    cooldown = 10
-    cooldown_counter = 0
+    cooldown = 10 # ticks
+    # counted down by BLOCK_STATE.tick_cooldowns()
+    cooldown_counter = stored('cooldown')
 
     def shoot(self):
         self.cooldown_counter = self.cooldown
-        Projectile(source=self, damage=1)
+        PROJECTILES.spawn(source=self, damage=1)
 
     def _upkeep(self):
-        super(BlasterBlock, self)._upkeep()
-        self.cooldown_counter -= 1
-        if self._active and self.cooldown_counter <= 0:
+        if self.cooldown_counter <= 0:
             self.shoot()
 
 
-SHIELD_IMAGE = load_image('images/shield_bubble.png')
+SHIELD_IMAGE = 'images/shield_bubble.png'
 class ShieldBlock(ControllableBlock):
+    __slots__ = ('_shield_shape',)
+    space_indexes = ControllableBlock.space_indexes + ('shields',)
     magnitude = 500
     image = 'shield'
-    _shield_body = None
-    _shield_shape = None
-    _shield_link = None
     radius = BLOCK_SIZE * 2
 
-    def activate(self):
-        density = 0.01
-        mass = density
-        inertia = pymunk.moment_for_circle(mass, 0, self.radius)
-        self._shield_body = pymunk.Body(mass, inertia)
-        self._shield_body.position = self._body.position
-        self._shield_shape = pymunk.Circle(self._shield_body, self.radius)
+    def __init__(self, point, body=None, angle=0):
+        self._shield_shape = None
+        super(ShieldBlock, self).__init__(point, body, angle)
+
+    def _attach(self, body, offset, angle):
+        shapes = super(ShieldBlock, self)._attach(body, offset, angle)
+        if self._shield_shape is not None:
+            SPACE.remove(self._shield_shape)
+            shapes.append(self._make_shield())
+        return shapes
+
+    def _shift(self, centre):
+        super(ShieldBlock, self)._shift(centre)
+        if self._shield_shape is not None:
+            self._shield_shape.unsafe_set_offset(self._offset)
+
+    def _make_shield(self):
+        # the bubble is one more shape on the ship's own body
+        self._shield_shape = shield_shape(self.id, self._shape.body,
+                                          self.radius, self._offset)
         self._shield_shape.elasticity = 0.5
         self._shield_shape.friction= 0.0
         self._shield_shape.collision_type = COLLISION_TYPES["shield"]
-        self._shield_link = PivotJoint(self._body, self._shield_body,
-                                                                (0, 0), (0, 0))
-        SPACE.add(self._shield_body, self._shield_shape, self._shield_link)
+        return self._shield_shape
+
+    def activate(self):
+        SPACE.add(self._make_shield())
 
     def deactivate(self):
-        SPACE.remove(self._shield_link, self._shield_body, self._shield_shape)
-        self._shield_body = self._shield_link = self._shield_shape = None
+        SPACE.remove(self._shield_shape)
+        self._shield_shape = None
 
-    def draw(self):
-        super(ShieldBlock, self).draw()
-        if self._active and not off_screen(self._shield_body.position):
-            draw_large_point(SHIELD_IMAGE.id, self._shield_body.position, self.radius)
+    def draw_effects(self):
+        p, r = self._body.drawn_position, self.radius
+        if not off_screen(p):
+            EFFECTS.add(SHIELD_IMAGE,
+                        [(p.x - r, p.y - r), (p.x + r, p.y - r),
+                         (p.x + r, p.y + r), (p.x - r, p.y + r)])
 
 
 class TractorBlock(ControllableBlock):
+    __slots__ = ('resource_count',)
     magnitude = 500
     image = 'shield'
-    _tractor_body = None
-    _tractor_shape = None
-    _tractor_link = None
     radius = BLOCK_SIZE * 10
-    resource_count = 0 # this will eventually be storage blocks?
+
+    def __init__(self, point, body=None, angle=0):
+        self.resource_count = 0 # this will eventually be storage blocks?
+        super(TractorBlock, self).__init__(point, body, angle)
 
     def activate(self):
-        density = 0.01
-        mass = density
-        inertia = pymunk.moment_for_circle(mass, 0, self.radius)
-        self._tractor_body = pymunk.Body(mass, inertia)
-        self._tractor_body.position = self._body.position
-        self._tractor_body._get_block = ref(self)
-        self._tractor_shape = pymunk.Circle(self._tractor_body, self.radius)
-        self._tractor_shape.collision_type = COLLISION_TYPES["tractor"]
-        self._tractor_shape.sensor = True
-        self._tractor_link = PivotJoint(self._body, self._tractor_body,
-                                                                (0, 0), (0, 0))
-        SPACE.add(self._tractor_body, self._tractor_shape, self._tractor_link)
+        RESOURCES.tractors.add(self)
 
     def deactivate(self):
-        SPACE.remove(self._tractor_link, self._tractor_body, self._tractor_shape)
-        self._tractor_body = self._tractor_link = self._tractor_shape = None
+        RESOURCES.tractors.discard(self)
 
-    def draw(self):
-        super(TractorBlock, self).draw()
-        if self._active and not off_screen(self._tractor_body.position):
-            draw_large_point(SHIELD_IMAGE.id, self._tractor_body.position, self.radius)
+    def draw_effects(self):
+        p, r = self._body.drawn_position, self.radius
+        if not off_screen(p):
+            EFFECTS.add(SHIELD_IMAGE,
+                        [(p.x - r, p.y - r), (p.x + r, p.y - r),
+                         (p.x + r, p.y + r), (p.x - r, p.y + r)])
 
 
 class ScannerBlock(ControllableBlock):
+    __slots__ = ('contacts',)
+    space_indexes = ControllableBlock.space_indexes + ('scanners',)
     magnitude = BLOCK_SIZE * 1000
     image = 'scanner'
 
-    ARROW = load_image('images/arrow.png')
-    ARROW.anchor_x = 16
-    ARROW.anchor_y = 16
-    _arrow_sprite = Sprite(ARROW)
+    ARROW = 'images/arrow.png'
+    ARROW_SIZE = 32
 
-    def draw(self):
-        super(ScannerBlock, self).draw()
-        if not self._active:
-            return
-        for b in SPACE.blocks:
-            if not isinstance(b, ReactorBlock) or b.has_exploded:
-                continue
-            v = b._body.position - self._body.position
-            d = v.length
-            if d > BLOCK_SIZE * 5 and d < self.magnitude:
-                v.length = BLOCK_SIZE * 5
-                pos = adjust_for_cam(self._body.position + v)
-                self._arrow_sprite._x, self._arrow_sprite._y = pos.x, pos.y
-                self._arrow_sprite.rotation = -(v.angle / math.pi * 180)
-                self._arrow_sprite.scale = (self.magnitude - d) / self.magnitude
-                self._arrow_sprite.draw()
+    def __init__(self, point, body=None, angle=0):
+        self.contacts = ()
+        super(ScannerBlock, self).__init__(point, body, angle)
+
+    def deactivate(self):
+        self.contacts = ()
+
+    def _upkeep(self):
+        # (offset, distance) of every reactor worth pointing at
+        _, offsets, distances = SENSORS.reactors_near(self._body.position,
+                                                      self.magnitude)
+        self.contacts = [(Vec2d(*o), d) for o, d in zip(offsets, distances)
+                         if d > BLOCK_SIZE * 5 and d < self.magnitude]
+
+    def draw_effects(self):
+        for v, d in self.contacts:
+            v = Vec2d(v)
+            v.length = BLOCK_SIZE * 5
+            pos = self._body.drawn_position + v
+            # arrows keep their size on screen whatever the zoom
+            r = (self.ARROW_SIZE / 2.0 * (self.magnitude - d) /
+                 self.magnitude / SPACE.scale)
+            corners = [Vec2d(-r, -r), Vec2d(-r, r),
+                       Vec2d(r, r), Vec2d(r, -r)]
+            EFFECTS.add(self.ARROW, [pos + c.rotated(v.angle)
+                                     for c in corners])
 
 
-ENGINE_FIRE = load_image('images/fire.png')
+ENGINE_FIRE = 'images/fire.png'
 
 
 class EngineBlock(ControllableBlock):
+    __slots__ = ()
+    space_indexes = ControllableBlock.space_indexes + ('engines',)
     magnitude = 500
     image = 'engine'
 
-    def _upkeep(self):
-        super(EngineBlock, self)._upkeep()
-        self._body.reset_forces()
-        if self._active:
-            v1 = Vec2d(0, self.magnitude)
-            v1.rotate(self._body.angle + float(self.direction) / 2 * math.pi)
-            self._body.apply_force(v1)
+    # Bodies keep their forces between steps and a ship's engines all push
+    # the same body, so the bodies pushed last tick are reset before the
+    # engines push again.
+    _thrusting = set()
 
-    def deactivate(self):
-        self._body.reset_forces()
+    @classmethod
+    def reset_thrust(cls):
+        for body in cls._thrusting:
+            body.reset_forces()
+        cls._thrusting.clear()
 
-    def draw(self):
-        super(EngineBlock, self).draw()
-        if self._active and not off_screen(self._body.position):
+    def _upkeep(self):
+        v1 = Vec2d(0, self.magnitude)
+        v1.rotate(self._body.angle + float(self.direction) / 2 * math.pi)
+        self._body.apply_force(v1)
+        self._thrusting.add(self._shape.body)
+
+    def draw_effects(self):
+        position = self._body.drawn_position
+        if not off_screen(position):
+            angle = self._body.drawn_angle
             offset = Vec2d(0, -BLOCK_SIZE)
-            offset.rotate(self._body.angle + float(self.direction) / 2 * math.pi)
-            points = [p + offset for p in self._shape.get_vertices()]
-            draw_rect(ENGINE_FIRE.id, points, direction=self.direction)
+            offset.rotate(angle + float(self.direction) / 2 * math.pi)
+            points = [position + offset + c.rotated(angle)
+                      for c in BLOCK_CORNERS]
+            EFFECTS.add(ENGINE_FIRE, points,
+                        direction=self.direction)
@@ -0,0 +1,133 @@
+"""The state of every block, kept in arrays with one row per block.
+
+A Block object is only a thin handle: its damage, direction, switches and
+cooldown live in BLOCK_STATE at the row given by its `id`, and its properties
+read and write those rows. Whatever has to look at every block each tick
+(cooldowns, which blocks to switch on or off, which ones are running) does it
+with a few numpy operations over whole arrays, and the Python objects are
+only touched for the blocks that actually have something to do.
+
+The rows of destroyed blocks are handed out again, so the arrays only ever
+hold as many rows as there were blocks in the world at once. Every row counts
+how many blocks have had it in `generation`, and a handle remembers the
+generation it was given: one that outlives its block is `destroyed` for good,
+even once its row belongs to another block.
+"""
+import numpy as np
+from operator import attrgetter
+from pool import Pool
+
+
+class BlockState(Pool):
+    """One row per block ever made. `alive` is False once a block has been
+    destroyed, and `awake` is True while its construction is simulated in
+    full (see construction.ACTIVE).
+    """
+    fields = {'damage': ((), np.float64),
+              'direction': ((), np.int8),
+              'exploded': ((), bool),
+              'on': ((), bool),
+              'powered': ((), bool),
+              'active': ((), bool),
+              'awake': ((), bool),
+              'priority': ((), np.int16),
+              'power_used': ((), np.int16),
+              'cooldown': ((), np.int32),
+              'generation': ((), np.uint32),
+    }
+
+    def __init__(self, capacity=1024):
+        # the handle of the block in each row, None once it is destroyed
+        self.blocks = []
+        # the rows of the blocks destroyed since the last recycle()
+        self._dead = []
+        super(BlockState, self).__init__(capacity)
+
+    def new(self, block):
+        """Claims a row for `block` and returns its id and generation. Rows
+        are handed out cleared, see recycle().
+        """
+        i = self._claim()
+        generation = self.generation.item(i) + 1
+        self.generation[i] = generation
+        if i < len(self.blocks):
+            self.blocks[i] = block
+        else:
+            self.blocks.append(block)
+        return i, generation
+
+    def holds(self, i, generation):
+        """Whether row `i` still belongs to the block it was given to as
+        `generation`.
+        """
+        return self.alive.item(i) and self.generation.item(i) == generation
+
+    def destroy(self, i):
+        """Marks a block as gone for good. Its row is handed out again after
+        the next recycle().
+        """
+        self.alive[i] = False
+        self.blocks[i] = None
+        self._dead.append(i)
+
+    def recycle(self):
+        """Clears and frees the rows of the blocks destroyed since the last
+        call, lowest first. Called between ticks, so that nothing still
+        queued from the tick a block was destroyed in can reach its row's
+        next block.
+        """
+        if self._dead:
+            dead = sorted(self._dead, reverse=True)
+            for name in self.fields:
+                if name != 'generation':
+                    getattr(self, name)[dead] = 0
+            self._free.extend(dead)
+            self._dead = []
+
+    def _handles(self, mask):
+        blocks = self.blocks
+        return [blocks[i] for i in np.nonzero(mask)[0].tolist()]
+
+    def tick_cooldowns(self):
+        """Counts every cooldown down by one tick."""
+        cooldown = self.cooldown[:len(self.blocks)]
+        cooldown[cooldown > 0] -= 1
+
+    def switching(self):
+        """The awake blocks to activate this tick, because they are switched
+        on and powered, and the ones to deactivate because they no longer
+        are.
+        """
+        n = len(self.blocks)
+        awake = self.awake[:n] & self.alive[:n]
+        running = self.on[:n] & self.powered[:n]
+        active = self.active[:n]
+        return (self._handles(awake & running & ~active),
+                self._handles(awake & active & ~running))
+
+    def running(self):
+        """Every awake block that is active."""
+        n = len(self.blocks)
+        return self._handles(self.awake[:n] & self.alive[:n] & self.active[:n])
+
+
+BLOCK_STATE = BlockState()
+
+
+def in_order(blocks):
+    """The blocks in `blocks` that are still in the world, in the order of
+    their ids. Walking a weak set through this goes the same way every run,
+    however long the garbage collector takes to drop destroyed blocks.
+    """
+    return sorted((b for b in blocks if not b.destroyed),
+                  key=attrgetter('id'))
+
+
+def stored(field, doc=None):
+    """A property keeping a block's value in BLOCK_STATE.`field`."""
+    def get(self):
+        return getattr(BLOCK_STATE, field).item(self.id)
+
+    def set(self, value):
+        getattr(BLOCK_STATE, field)[self.id] = value
+    return property(get, set, doc=doc)
@@ -0,0 +1,148 @@
+"""Ship files compiled into blueprints, and spawning ships from them.
+
+A ship file is only read and parsed the first time it is spawned. Its
+blueprint keeps everything needed to build the ship again: the block types
+with their offsets and directions, which blocks are welded together, the key
+bindings with their keys already looked up, and the mass and moment of the
+finished ship. Building a ship from it makes one body with a shape per block
+and adds them to the space together; spawn_fleet() adds a whole fleet in a
+single call.
+"""
+import json
+import pymunk
+from pyglet.window import key
+from pymunk.vec2d import Vec2d
+from weakref import ref
+from space import SPACE
+from construction import Construction
+from blocks import (Block, ShieldBlock, EngineBlock, ReactorBlock,
+                    CockpitBlock, BlasterBlock, ArmorBlock, ScannerBlock,
+                    TractorBlock, AngleLeftBlock, AngleRightBlock,
+                    FinLeftBlock, FinRightBlock, BLOCK_SIZE)
+
+BLOCK_MAP = {'b': Block,
+             'a': ArmorBlock,
+             's': ShieldBlock,
+             'e': EngineBlock,
+             'r': ReactorBlock,
+             'c': CockpitBlock,
+             'l': BlasterBlock,
+             'S': ScannerBlock,
+             't': TractorBlock,
+             'k': AngleLeftBlock,
+             'K': AngleRightBlock,
+             'f': FinLeftBlock,
+             'F': FinRightBlock,
+}
+
+_blueprints = {}
+
+
+class Blueprint(object):
+
+    def __init__(self, data):
+        # (block class, offset from the ship's centre of mass, direction)
+        self.cells = []
+        grid = {}
+        rows = data['blocks']
+        for i, line in enumerate(rows):
+            for j, block in enumerate(line):
+                if block == ' ':
+                    continue
+                dimensions = Vec2d(len(rows) - 1, len(line) - 1)
+                offset = Vec2d(dimensions.x / 2 - j,
+                               dimensions.y / 2 - i) * BLOCK_SIZE
+                grid[i, j] = len(self.cells)
+                self.cells.append((BLOCK_MAP[block], offset,
+                                   int(data['rotation'][i][j])))
+        # pairs of indexes into cells, one for every weld
+        self.welds = [(grid[i, j], grid[n]) for i, j in sorted(grid)
+                      for n in ((i - 1, j), (i, j - 1)) if n in grid]
+
+        # every cockpit controls every binding:
+        # (cockpit, slave, key, binding type, priority)
+        self.cockpits = [n for n, cell in enumerate(self.cells)
+                         if cell[0] == CockpitBlock]
+        self.bindings = []
+        for c in self.cockpits:
+            for binding in data['keybindings']:
+                x, y = binding['position']
+                self.bindings.append((c, grid[y, x],
+                                      getattr(key, binding['key']),
+                                      binding['type'],
+                                      binding.get('priority', 0)))
+
+        masses = [cell[0].material.density for cell in self.cells]
+        self.mass = float(sum(masses))
+        self.centre = sum((m * cell[1] for m, cell in zip(masses, self.cells)),
+                          Vec2d(0, 0)) / self.mass
+        self.cells = [(cls, offset - self.centre, direction)
+                      for cls, offset, direction in self.cells]
+        self.moment = sum(pymunk.moment_for_box(m, BLOCK_SIZE, BLOCK_SIZE) +
+                          m * cell[1].get_length_sqrd()
+                          for m, cell in zip(masses, self.cells))
+
+    def build(self, position, angle=0, player_controlled=False):
+        """Makes the ship with its centre of the grid at `position`, without
+        adding anything to the space. Returns its construction and the body
+        and shapes for the caller to add.
+        """
+        body = pymunk.Body(self.mass, self.moment)
+        body.position = Vec2d(position) + self.centre.rotated(angle)
+        body.angle = angle
+        blocks = []
+        for cls, offset, direction in self.cells:
+            block = cls(offset, body)
+            block.direction = direction
+            blocks.append(block)
+        for a, b in self.welds:
+            blocks[a]._adjacent_blocks.append(blocks[b])
+            blocks[b]._adjacent_blocks.append(blocks[a])
+
+        for c, s, code, binding_type, priority in self.bindings:
+            target = blocks[s]
+            target.key = code
+            target.binding_type = binding_type
+            target.power_priority = priority
+            blocks[c].slave_blocks.add(target)
+        for c in self.cockpits:
+            blocks[c].update_controls()
+            if player_controlled:
+                SPACE.camera_lock = ref(blocks[c])
+                blocks[c].ai = False
+        # TODO: pre-activate the 'inverted' bindings
+        # TODO: in-game ship editor
+
+        return Construction(blocks, body), [body] + [b._shape for b in blocks]
+
+
+def load_blueprint(filename):
+    """The blueprint for a file in ships/, compiled the first time."""
+    if filename not in _blueprints:
+        with open('ships/' + filename, 'r') as f:
+            _blueprints[filename] = Blueprint(json.load(f))
+    return _blueprints[filename]
+
+
+def spawn_ship(filename, spawn_location, player_controlled=False, angle=0):
+    """Spawns a ship from a file in ships/. Returns its construction."""
+    construction, objects = load_blueprint(filename).build(
+        spawn_location, angle, player_controlled)
+    SPACE.add(*objects)
+    return construction
+
+
+def spawn_fleet(filename, locations, angle=0):
+    """Spawns one ship at each of `locations`, adding all of them to the
+    space at once. Returns their constructions.
+    """
+    blueprint = load_blueprint(filename)
+    constructions = []
+    objects = []
+    for location in locations:
+        construction, parts = blueprint.build(location, angle)
+        constructions.append(construction)
+        objects.extend(parts)
+    SPACE.add(*objects)
+    return constructions
+
@@ -0,0 +1,334 @@
+"""Constructions are groups of blocks welded together, directly or through
+other blocks. Every block belongs to exactly one construction, so asking which
+ship a block is part of is a single attribute lookup.
+
+A construction is a single rigid pymunk body with one shape per block, so a
+welded ship costs the physics engine one body and no constraints however many
+blocks it has. Each block remembers where its shape sits on that body (its
+offset and angle in body coordinates) and `block._body` is a BlockBody that
+answers position, velocity and so on for that spot.
+
+Constructions are merged when blocks are welded and split again when a
+destroyed block breaks its welds. Merges only mark the construction as needing
+a new body, so welding a whole ship together builds its body once; call
+rebuild_pending() before stepping the space. Splits happen straight away:
+the pieces that break off get bodies of their own, and the biggest keeps its
+body, which only has its mass, moment and centre brought up to date.
+Any change marks the power grid of the constructions involved as dirty.
+
+Walking a construction gives its blocks in the order they were made, and
+pending constructions are rebuilt in the order they were merged, so that the
+same session plays out the same way every time (see replay.py).
+"""
+import pymunk
+from collections import OrderedDict
+from operator import attrgetter
+from pymunk.vec2d import Vec2d
+from weakref import ref
+from space import SPACE
+from materials import BLOCK_SIZE
+from power import mark_dirty
+from blockstate import BLOCK_STATE
+
+# levels of detail a construction can be simulated at, see simulation.tick_lod
+ACTIVE, COASTING, FROZEN = range(3)
+
+_pending = OrderedDict()
+
+
+class BlockBody(object):
+    """Stands in for the body a block would have if it were on its own.
+
+    Reads give the block's own position, angle and velocity, and forces and
+    impulses are applied to the construction's body at the block's position.
+    Setting the position or angle moves the whole body, so it is only meant
+    for blocks that are not welded to anything yet.
+    """
+    __slots__ = ('_block',)
+
+    def __init__(self, block):
+        self._block = block
+
+    @property
+    def body(self):
+        """The pymunk body this block's shape is attached to."""
+        return self._block._shape.body
+
+    def _arm(self):
+        """The block's offset from the body's centre, in world directions."""
+        body = self._block._shape.body
+        return self._block._offset.rotated(body.angle)
+
+    @property
+    def position(self):
+        return self._block._shape.body.position + self._arm()
+
+    @position.setter
+    def position(self, value):
+        body = self._block._shape.body
+        body.position = Vec2d(value) - self._arm()
+        body.activate()
+
+    @property
+    def angle(self):
+        return self._block._shape.body.angle + self._block._local_angle
+
+    @angle.setter
+    def angle(self, value):
+        body = self._block._shape.body
+        position = self.position
+        body.angle = value - self._block._local_angle
+        self.position = position
+
+    @property
+    def drawn_position(self):
+        """Where the block should be drawn this frame, SPACE.lag seconds
+        before the last tick.
+        """
+        return self.position - self.velocity * SPACE.lag
+
+    @property
+    def drawn_angle(self):
+        return self.angle - self.angular_velocity * SPACE.lag
+
+    @property
+    def rotation_vector(self):
+        return Vec2d(1, 0).rotated(self.angle)
+
+    @property
+    def velocity(self):
+        body = self._block._shape.body
+        return (body.velocity +
+                self._arm().perpendicular() * body.angular_velocity)
+
+    @property
+    def angular_velocity(self):
+        return self._block._shape.body.angular_velocity
+
+    def apply_force(self, f):
+        self._block._shape.body.apply_force(f, self._arm())
+
+    def apply_impulse(self, j):
+        self._block._shape.body.apply_impulse(j, self._arm())
+
+
+def _block_state(block):
+    """Where a block is and how it moves, in world coordinates."""
+    body = block._shape.body
+    r = block._offset.rotated(body.angle)
+    w = body.angular_velocity
+    return (body.position + r, body.angle + block._local_angle,
+            body.velocity + r.perpendicular() * w, w)
+
+
+def rebuild(constructions):
+    """Gives every construction a new body holding all of its blocks.
+
+    The new bodies carry on the motion of the blocks that make them up:
+    linear and angular momentum are kept, so fragments of a spinning ship fly
+    apart the way the pieces were moving and a merge moves as one. Every
+    block on the old bodies must belong to one of the constructions, since
+    the old bodies are removed from the space.
+    """
+    states = {}
+    old_bodies = OrderedDict()
+    for c in constructions:
+        for block in c:
+            old_bodies[block._shape.body] = None
+            states[block] = _block_state(block)
+    for c in constructions:
+        c._build(states)
+    SPACE.remove(*old_bodies)
+
+
+def rebuild_pending():
+    """Builds the bodies of every construction merged since the last call."""
+    if _pending:
+        rebuild([c for c in _pending if c.blocks])
+        _pending.clear()
+
+
+class Construction(object):
+    _lod = ACTIVE
+    _body = None
+
+    def __init__(self, blocks=(), body=None):
+        self.blocks = set()
+        self.body = body
+        for block in blocks:
+            self.add(block)
+        mark_dirty(self)
+
+    def __iter__(self):
+        return iter(sorted(self.blocks, key=attrgetter('id')))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block):
+        return block in self.blocks
+
+    @property
+    def body(self):
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        # so that anything holding the body can find the construction again
+        if body is not None:
+            body._get_construction = ref(self)
+            SPACE.constructions.add(self)
+        else:
+            SPACE.constructions.discard(self)
+        self._body = body
+
+    @property
+    def lod(self):
+        """How much of the simulation the construction gets, see tick_lod."""
+        return self._lod
+
+    @lod.setter
+    def lod(self, lod):
+        # only blocks on ACTIVE constructions are awake in BLOCK_STATE
+        if (lod == ACTIVE) != (self._lod == ACTIVE):
+            BLOCK_STATE.awake[[b.id for b in self.blocks]] = lod == ACTIVE
+        self._lod = lod
+
+    def add(self, block):
+        self.blocks.add(block)
+        block._construction = self
+        BLOCK_STATE.awake[block.id] = self._lod == ACTIVE
+
+    def discard(self, block):
+        """Forgets a block that was destroyed, so it is not kept alive by
+        its construction.
+        """
+        self.blocks.discard(block)
+
+    def merge(self, other):
+        """Joins two constructions, moving the smaller into the larger.
+        Returns the construction that survived, whose body is rebuilt by the
+        next rebuild_pending().
+        """
+        if other is self:
+            return self
+        if len(other) > len(self):
+            return other.merge(self)
+        for block in other.blocks:
+            self.add(block)
+        other.blocks = set()
+        other.body = None
+        _pending.pop(other, None)
+        _pending[self] = None
+        mark_dirty(self)
+        return self
+
+    def remove(self):
+        """Takes the construction and every block on it out of the world for
+        good, as when it moves to another sector (see sectors.py).
+        """
+        if self in _pending:
+            rebuild_pending()
+        body = self.body
+        for block in self:
+            block._forget()
+        SPACE.remove(body)
+        self.body = None
+
+    def _build(self, states):
+        """Makes a body at the blocks' centre of mass, moving the way they
+        were, and moves their shapes onto it.
+        """
+        blocks = list(self)
+        masses = [b.material.density for b in blocks]
+        mass = float(sum(masses))
+        centre = sum((m * states[b][0] for m, b in zip(masses, blocks)),
+                     Vec2d(0, 0)) / mass
+        velocity = sum((m * states[b][2] for m, b in zip(masses, blocks)),
+                       Vec2d(0, 0)) / mass
+        moment = momentum = 0.0
+        for m, b in zip(masses, blocks):
+            position, _, v, w = states[b]
+            r = position - centre
+            own = pymunk.moment_for_box(m, BLOCK_SIZE, BLOCK_SIZE)
+            moment += own + m * r.get_length_sqrd()
+            momentum += own * w + m * r.cross(v - velocity)
+
+        body = pymunk.Body(mass, moment)
+        body.position = centre
+        body.velocity = velocity
+        body.angular_velocity = momentum / moment
+        shapes = []
+        for b in blocks:
+            position, angle, _, _ = states[b]
+            shapes.extend(b._attach(body, position - centre, angle))
+        SPACE.add(body, *shapes)
+        self.body = body
+
+    def _recentre(self):
+        """Brings the body's mass, moment and centre of gravity up to date
+        after blocks have left it, without moving or stopping the blocks
+        still on it.
+        """
+        body = self.body
+        blocks = list(self)
+        masses = [b.material.density for b in blocks]
+        mass = float(sum(masses))
+        centre = sum((m * b._offset for m, b in zip(masses, blocks)),
+                     Vec2d(0, 0)) / mass
+        moment = 0.0
+        for m, b in zip(masses, blocks):
+            b._shift(centre)
+            moment += (pymunk.moment_for_box(m, BLOCK_SIZE, BLOCK_SIZE) +
+                       m * b._offset.get_length_sqrd())
+        arm = centre.rotated(body.angle)
+        body.position += arm
+        body.velocity += arm.perpendicular() * body.angular_velocity
+        body.mass = mass
+        body.moment = moment
+
+    def detach(self, block, neighbours):
+        """Removes a block that just lost all of its welds and splits whatever
+        is left into fragments. Only the former neighbours of the block can
+        start a new fragment, so each is flood filled in turn; the largest
+        fragment keeps this construction and its body, and the block and the
+        other fragments fly off on bodies of their own. Returns the new
+        constructions.
+        """
+        if self in _pending:
+            rebuild_pending()
+        self.blocks.discard(block)
+        if not self.blocks:
+            # it was on its own already, so it can keep its body
+            Construction([block], self.body)
+            self.body = None
+            return []
+        loose = Construction([block])
+        mark_dirty(self)
+
+        fragments = []
+        seen = set()
+        for start in neighbours:
+            if start in seen or start not in self.blocks:
+                continue
+            fragment = set([start])
+            stack = [start]
+            while stack:
+                for b in stack.pop()._adjacent_blocks:
+                    if b not in fragment:
+                        fragment.add(b)
+                        stack.append(b)
+            seen |= fragment
+            fragments.append(fragment)
+
+        new = []
+        if len(fragments) > 1:
+            fragments.sort(key=len, reverse=True)
+            self.blocks = fragments[0]
+            new = [Construction(f) for f in fragments[1:]]
+        leaving = [loose] + new
+        states = dict((b, _block_state(b)) for c in leaving for b in c)
+        self._recentre()
+        for c in leaving:
+            c._build(states)
+        return new
@@ -0,0 +1,78 @@
+"""Damage is recorded while things happen and dealt all at once afterwards.
+
+Collision callbacks run in the middle of the physics step, where removing
+shapes or splitting a ship onto new bodies is not safe, and a big blast can
+hit the same block many times over. So nothing that hits anything deals
+damage straight away: it records an event (the shape hit, the damage and the
+impulse) with DAMAGE.record(), and DAMAGE.resolve() deals the lot once the
+step is over.
+
+What an event does depends on the collision type of the shape hit, looked up
+in HANDLERS, and types that are not there (shields, say) take nothing. Every
+block hit during a tick takes all of its damage and impulses together, in a
+single take_damage() call.
+"""
+from pymunk.vec2d import Vec2d
+from materials import COLLISION_TYPES
+
+
+def damage_blocks(events):
+    """Sums the damage and impulses every block took and deals them."""
+    hits = {}
+    for shape, amount, impulse in events:
+        block = shape._get_block()
+        if block is None:
+            continue
+        if block in hits:
+            total, push = hits[block]
+            hits[block] = total + amount, push + impulse
+        else:
+            hits[block] = amount, Vec2d(impulse)
+    # in the order the blocks were made, so a tick always plays out the same
+    for block in sorted(hits, key=lambda b: b.id):
+        amount, impulse = hits[block]
+        if block.destroyed:
+            continue
+        # pushed first, so a block knocked loose flies off with the push
+        if impulse:
+            block._body.apply_impulse(impulse)
+        if amount:
+            block.take_damage(amount)
+
+
+# what happens to a shape of each collision type when it is hit
+HANDLERS = {COLLISION_TYPES['ship']: damage_blocks,
+}
+
+
+class DamageQueue(object):
+
+    def __init__(self):
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, shape, amount, impulse=(0, 0)):
+        """Notes that `shape` took `amount` damage and was pushed by
+        `impulse`, to be dealt by the next resolve().
+        """
+        self.events.append((shape, amount, impulse))
+
+    def resolve(self):
+        """Deals every event recorded since the last call, grouped by the
+        collision type of the shape hit.
+        """
+        if not self.events:
+            return
+        events, self.events = self.events, []
+        by_type = {}
+        for event in events:
+            by_type.setdefault(event[0].collision_type, []).append(event)
+        for collision_type, hits in by_type.items():
+            handler = HANDLERS.get(collision_type)
+            if handler is not None:
+                handler(hits)
+
+
+DAMAGE = DamageQueue()
@@ -0,0 +1,71 @@
+"""Wreckage left over from battles.
+
+A block that has been blown off its ship (it has exploded but has not taken
+enough damage to be destroyed) drifts around as a body of its own until
+something finishes it off, which may be never. DEBRIS keeps track of these
+blocks, oldest first, and trim() keeps their number under
+settings.MAX_DEBRIS so that the world can't fill up with wreckage.
+"""
+import random
+from collections import OrderedDict
+import numpy as np
+from space import SPACE
+from resources import RESOURCES
+import settings
+
+
+class DebrisManager(object):
+
+    def __init__(self):
+        # oldest first
+        self._blocks = OrderedDict()
+        # how many were cleared away by trim(), broken up into resources or
+        # simply removed
+        self.salvaged = 0
+        self.despawned = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __contains__(self, block):
+        return block in self._blocks
+
+    def add(self, block):
+        self._blocks[block] = None
+
+    def discard(self, block):
+        self._blocks.pop(block, None)
+
+    def counts(self):
+        return {'debris': len(self), 'salvaged': self.salvaged,
+                'despawned': self.despawned}
+
+    def trim(self, limit=None):
+        """Clears away debris until at most `limit` (MAX_DEBRIS by default)
+        is left. Debris beyond LOD_ACTIVE_RADIUS goes first, farthest first,
+        and simply disappears. After that the oldest goes, breaking up into
+        resources for the player to collect.
+        """
+        if limit is None:
+            limit = settings.MAX_DEBRIS
+        excess = len(self) - limit
+        if excess <= 0:
+            return
+        blocks = list(self._blocks)
+        positions = np.array([tuple(b._body.position) for b in blocks])
+        distance = np.hypot(*(positions - tuple(SPACE.last_pos)).T)
+        far = distance > settings.LOD_ACTIVE_RADIUS
+        order = np.lexsort((np.where(far, -distance, np.arange(len(blocks))),
+                            ~far))
+        for i in order[:excess].tolist():
+            block = blocks[i]
+            if far[i]:
+                self.despawned += 1
+            else:
+                for _ in range(random.randint(1, 5)):
+                    RESOURCES.spawn(block)
+                self.salvaged += 1
+            block.remove()
+
+
+DEBRIS = DebrisManager()
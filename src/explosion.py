@@ -1,13 +1,11 @@
-import pymunk
 import pyglet
 import random
 from pymunk.vec2d import Vec2d
 from materials import COLLISION_TYPES
 from space import SPACE
-from weakref import ref
 import settings
-from pyglet import gl
-from renderer import adjust_for_cam, off_screen
+from particles import EXPLOSION_EFFECTS
+from damage import DAMAGE
 
 if settings.SOUND:
     EXPLOSION_SFX = [
@@ -16,93 +14,41 @@ if settings.SOUND:
         pyglet.resource.media('sfx/explode3.flac', streaming=False),
     ]
 
-BLOCK_SIZE = 16 # TODO: this is duplicated
-
-EXPLOSION_ANIM = pyglet.image.load('images/explosion2.png').mipmapped_texture
-ANIM_ROWS = 4.0
-ANIM_COLUMNS = 8.0
-ANIM_FRAMES = 3 * 8 # last row is empty
-
-FRAME_POSITIONS = []
-for i in xrange(ANIM_FRAMES):
-    FRAME_POSITIONS.append(((i % ANIM_COLUMNS / ANIM_COLUMNS), (i // ANIM_COLUMNS) / ANIM_ROWS))
-
-
-class Explosion:
-    ticks = 20
-
-    # sprites
-    image = 'images/explosion2.png'
-    image_anchor = Vec2d(32, 32)
-
-    def __init__(self, point, radius, velocity=Vec2d(0, 0), damage=0):
-        self.radius = radius
-        self.damage = damage
-
-        inertia = pymunk.moment_for_circle(pymunk.inf, 0, radius)
-        self._body = pymunk.Body(pymunk.inf, inertia)
-        self._body.position = point
-        self._body.velocity = velocity
-        self._shape = pymunk.Circle(self._body, radius)
-        self._shape.collision_type = COLLISION_TYPES['explosion']
-        self._shape._get_explosion = ref(self)
-        SPACE.add(self._body, self._shape)
-        SPACE.register_explosion(self)
-
-        # play SFX
-        if settings.SOUND:
-            sound = random.choice(EXPLOSION_SFX)
-            # TODO: 3D sound
-            #volume = (500 - (SPACE.camera_lock()._body.position - self._body.position).length) / 500
-            #if volume > 0:
-            #    print volume
-            #    sound.volume = random.choice([1.0, .5, .25])
-            sound.play()
-
-    def upkeep(self):
-        self.ticks -= 1
-        if self.ticks <= 0:
-            SPACE.remove(self._body, self._shape)
-            SPACE.explosions.remove(self)
-
-    def draw(self):
-        # TODO: Let's use particles. And lighting! Way more fun.
-
-        p = adjust_for_cam(self._body.position)
-
-        if off_screen(self._body.position):
-            return
-
-        gl.glEnable(gl.GL_TEXTURE_2D) # enables texturing, without it everything is white
-        gl.glBindTexture(gl.GL_TEXTURE_2D, EXPLOSION_ANIM.id)
-        gl.glEnable(gl.GL_BLEND)
-        gl.glBlendFunc(gl.GL_SRC_ALPHA,gl.GL_ONE_MINUS_SRC_ALPHA);
-
-        # TODO: more optimized to draw as one large batch
-        gl.glBegin(gl.GL_QUADS)
-
-        r = (self.radius + BLOCK_SIZE) * SPACE.scale
-        for i, vert in enumerate([Vec2d(p.x - r, p.y - r),
-                                  Vec2d(p.x + r, p.y - r),
-                                  Vec2d(p.x + r, p.y + r),
-                                  Vec2d(p.x - r, p.y + r),]):
-
-            # TODO: This is really ugly, and a lot of shared code with the
-            #       blocks. Let's write a draw_rect function to handle this
-            #       with an optional animation option.
-
-            x = (i // 2)
-            if x == 0:
-                x = FRAME_POSITIONS[int((20 - self.ticks) / 20. * ANIM_FRAMES)][0]
-            else:
-                x = FRAME_POSITIONS[int((20 - self.ticks) / 20. * ANIM_FRAMES)][0] + 1 / ANIM_COLUMNS
-            y = ((i + 1) // 2) % 2
-            if y == 0:
-                y = FRAME_POSITIONS[int((20 - self.ticks) / 20. * ANIM_FRAMES)][1]
-            else:
-                y = FRAME_POSITIONS[int((20 - self.ticks) / 20. * ANIM_FRAMES)][1] + 1 / ANIM_ROWS
-
-            gl.glTexCoord2f(x, y)
-            gl.glVertex3f(vert.x, vert.y, 0)
-
-        gl.glEnd()
+# sounds are picked with their own generator, so that playing them or not
+# never changes what happens in the game
+SFX_RANDOM = random.Random()
+
+# how hard an explosion pushes a block, per unit of distance inside its radius
+PUSH = 4
+
+
+def explode(point, radius, velocity=Vec2d(0, 0), damage=0):
+    """Blows up at `point`. Every ship shape within `radius` is hit once,
+    right now: the closer it is the more damage it takes, up to `damage`,
+    and the harder it is pushed. What is left is only the animation in
+    particles.EXPLOSION_EFFECTS, drifting with `velocity`.
+    """
+    EXPLOSION_EFFECTS.spawn(point, radius, velocity)
+    hull = (COLLISION_TYPES['ship'], COLLISION_TYPES['remote'])
+    for hit in SPACE.nearest_point_query(point, radius):
+        shape = hit['shape']
+        if shape.collision_type not in hull:
+            continue
+        falloff = min(1.0, 1.0 - hit['distance'] / radius)
+        # pushes the block where it is, so a blast off centre spins the ship
+        bb = shape.bb
+        push = Vec2d(point) - Vec2d((bb.left + bb.right) / 2,
+                                    (bb.bottom + bb.top) / 2)
+        if push.length:
+            push.length = (radius - push.length) * PUSH
+        DAMAGE.record(shape, damage * falloff, push)
+
+    # play SFX
+    if settings.SOUND:
+        sound = SFX_RANDOM.choice(EXPLOSION_SFX)
+        # TODO: 3D sound
+        #volume = (500 - (SPACE.camera_lock()._body.position - point).length) / 500
+        #if volume > 0:
+        #    print volume
+        #    sound.volume = random.choice([1.0, .5, .25])
+        sound.play()
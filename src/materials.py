@@ -1,5 +1,12 @@
 """Materials hold the physical properties and collision types of all objects.
 """
+from pymunk.vec2d import Vec2d
+
+# the width and height of every block
+BLOCK_SIZE = 16
+# the corners of a block around its centre, in the order pymunk gives them
+BLOCK_CORNERS = [Vec2d(-1, -1) * BLOCK_SIZE / 2, Vec2d(-1, 1) * BLOCK_SIZE / 2,
+                 Vec2d(1, 1) * BLOCK_SIZE / 2, Vec2d(1, -1) * BLOCK_SIZE / 2]
 
 COLLISION_TYPES = {
     "ship": 1,
@@ -9,6 +16,8 @@ COLLISION_TYPES = {
     "resource": 5,
     "tractor": 6,
     "ghost": 7,
+    # the hull of a ship that belongs to a neighbouring sector, see sectors.py
+    "remote": 8,
 }
 
 
@@ -0,0 +1,92 @@
+"""Array-backed particle systems.
+
+Particles live in preallocated numpy arrays instead of being Python objects,
+so spawning one is just claiming a free slot and a frame of updates or
+drawing is a handful of bulk operations however many are alive.
+"""
+import numpy as np
+from pool import Pool
+from space import SPACE
+from materials import BLOCK_SIZE
+from renderer import load_image, visible_bounds, draw_quad_arrays
+
+EXPLOSION_ANIM = 'images/explosion2.png'
+ANIM_ROWS = 4
+ANIM_COLUMNS = 8
+ANIM_FRAMES = 3 * 8 # last row is empty
+EXPLOSION_TICKS = 20
+
+# corners of an explosion quad and the matching corners of one animation frame
+EXPLOSION_CORNERS = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)],
+                             dtype=np.float64)
+FRAME_CORNERS = (np.array([(0, 0), (0, 1), (1, 1), (1, 0)], dtype=np.float64)
+                 / (ANIM_COLUMNS, ANIM_ROWS))
+
+
+class ParticlePool(Pool):
+    """A Pool with one slot per particle."""
+
+    def drawn_positions(self, slots):
+        """Where the particles in `slots` should be drawn this frame, moved
+        back along their velocity to SPACE.lag seconds before the last tick.
+        """
+        return self.positions[slots] - self.velocities[slots] * SPACE.lag
+
+
+class ExplosionParticles(ParticlePool):
+    """Every explosion animation in the world, one slot per explosion."""
+    fields = {'positions': ((2,), np.float64),
+              'velocities': ((2,), np.float64),
+              'radii': ((), np.float64),
+              'ticks': ((), np.int32),
+    }
+
+    def spawn(self, point, radius, velocity):
+        i = self._claim()
+        self.positions[i] = point.x, point.y
+        self.velocities[i] = velocity.x, velocity.y
+        self.radii[i] = radius
+        self.ticks[i] = EXPLOSION_TICKS
+
+    def update(self, dt):
+        """Drifts every explosion the way pymunk would move a body with
+        infinite mass, and frees the ones that finished animating.
+        """
+        if not len(self):
+            return
+        alive = self.alive
+        self.velocities[alive] *= SPACE.damping ** dt
+        self.positions[alive] += self.velocities[alive] * dt
+        self.ticks[alive] -= 1
+        self._release(self.ticks <= 0)
+
+    def draw(self):
+        if not len(self):
+            return
+        live = np.nonzero(self.alive)[0]
+        positions = self.drawn_positions(live)
+        radii = self.radii[live] + BLOCK_SIZE
+        left, bottom, right, top = visible_bounds()
+        x, y = positions[:, 0], positions[:, 1]
+        shown = ((x + radii > left) & (x - radii < right) &
+                 (y + radii > bottom) & (y - radii < top))
+        if not shown.any():
+            return
+        positions, radii, live = positions[shown], radii[shown], live[shown]
+
+        elapsed = EXPLOSION_TICKS - self.ticks[live]
+        frames = elapsed * ANIM_FRAMES // EXPLOSION_TICKS
+        frame_x = (frames % ANIM_COLUMNS) / float(ANIM_COLUMNS)
+        frame_y = (frames // ANIM_COLUMNS) / float(ANIM_ROWS)
+
+        vertices = (positions[:, None, :] +
+                    EXPLOSION_CORNERS * radii[:, None, None])
+        tex_coords = np.empty_like(vertices)
+        tex_coords[:, :, 0] = frame_x[:, None] + FRAME_CORNERS[:, 0]
+        tex_coords[:, :, 1] = frame_y[:, None] + FRAME_CORNERS[:, 1]
+        draw_quad_arrays(np.ascontiguousarray(vertices, dtype=np.float32),
+                         np.ascontiguousarray(tex_coords, dtype=np.float32),
+                         [(load_image(EXPLOSION_ANIM).id, 0, len(live))])
+
+
+EXPLOSION_EFFECTS = ExplosionParticles()
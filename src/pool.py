@@ -0,0 +1,63 @@
+"""Things kept as rows of parallel numpy arrays instead of Python objects.
+
+Adding one is just claiming a free row, and updating all of them is a
+handful of bulk operations however many there are. Particles (see
+particles.py) and the state of blocks (see blockstate.py) are both kept
+this way.
+"""
+import numpy as np
+
+
+class Pool(object):
+    """Parallel numpy arrays with one row per item. Subclasses list their
+    arrays in `fields` as name: (shape of one item's value, dtype). Rows
+    are recycled through a free list and the arrays double when they fill
+    up.
+    """
+    fields = {}
+
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        for name, (shape, dtype) in self.fields.items():
+            setattr(self, name, np.zeros((0,) + shape, dtype=dtype))
+        self.alive = np.zeros(0, dtype=bool)
+        self._free = []
+        self._grow(capacity)
+
+    def __len__(self):
+        return self.capacity - len(self._free)
+
+    def _grow(self, capacity):
+        old = self.capacity
+        for name in list(self.fields) + ['alive']:
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+        # hand out the lowest rows first to keep the live ones packed
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def _claim(self):
+        """Returns the index of a free row, now marked alive."""
+        if not self._free:
+            self._grow(self.capacity * 2)
+        i = self._free.pop()
+        self.alive[i] = True
+        return i
+
+    def extend(self, **columns):
+        """Claims a row for every row of the given arrays, which are named
+        after `fields`, and fills them in. Returns the rows.
+        """
+        rows = len(next(iter(columns.values())))
+        slots = [self._claim() for _ in xrange(rows)]
+        for name, values in columns.items():
+            getattr(self, name)[slots] = values
+        return slots
+
+    def _release(self, dead):
+        """Frees every live row where the boolean array `dead` is True."""
+        dead = dead & self.alive
+        self.alive[dead] = False
+        self._free.extend(np.nonzero(dead)[0].tolist())
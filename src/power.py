@@ -0,0 +1,56 @@
+"""Power distribution.
+
+Every construction is its own power grid: its reactors supply power and its
+switched on controllable blocks consume it. A grid only needs solving again
+when something about it changes (a block is switched on or off, blocks are
+welded, or a destroyed block splits the ship), so constructions are marked
+dirty when that happens and tick_power only solves the dirty ones, a few
+every tick, in the order they were dirtied.
+"""
+from collections import OrderedDict
+
+_dirty = OrderedDict()
+
+
+def mark_dirty(construction):
+    _dirty[construction] = None
+
+
+def pending():
+    """How many grids are waiting to be solved."""
+    return len(_dirty)
+
+
+def solve(construction):
+    """Hands out a grid's power in one pass, highest priority consumers first.
+    Each consumer draws from the first reactor with enough spare power.
+    """
+    reactors = []
+    consumers = []
+    for b in construction:
+        if hasattr(b, 'power_generated'):
+            b.power_used = 0
+            if not b.has_exploded:
+                reactors.append(b)
+        elif hasattr(b, 'power_requirement'):
+            # switched off ones too, or they would come back on still
+            # counted as powered
+            b.powered = False
+            if b.on:
+                consumers.append(b)
+    consumers.sort(key=lambda b: -b.power_priority)
+
+    for c in consumers:
+        for r in reactors:
+            if r.power_used + c.power_requirement <= r.power_generated:
+                r.power_used += c.power_requirement
+                c.powered = True
+                break
+
+
+def solve_dirty(limit=None):
+    """Solves the dirty grids, or at most `limit` of them."""
+    if limit is None:
+        limit = len(_dirty)
+    for _ in xrange(min(limit, len(_dirty))):
+        solve(_dirty.popitem(last=False)[0])
@@ -1,17 +1,13 @@
 import math
+import numpy as np
 import pyglet
-import pymunk
 import random
 import settings
-from pymunk.vec2d import Vec2d
-from materials import COLLISION_TYPES
+from materials import COLLISION_TYPES, BLOCK_SIZE
 from space import SPACE
-from weakref import ref
-from pyglet import gl
-from renderer import adjust_for_cam
-
-# TODO: duplicated
-BLOCK_SIZE = 16
+from particles import ParticlePool
+from damage import DAMAGE
+from renderer import load_image, draw_point_sprites, visible_points
 
 if settings.SOUND:
     BLASTER_SFX = [
@@ -20,48 +16,82 @@ if settings.SOUND:
         #pyglet.resource.media('sfx/laser3.wav', streaming=False),
     ]
 
-BLASTER_IMAGE = pyglet.image.load('images/blast.png').mipmapped_texture
+# sounds are picked with their own generator, so that playing them or not
+# never changes what happens in the game
+SFX_RANDOM = random.Random()
+
+BLASTER_IMAGE = 'images/blast.png'
+
+# what a shot stops at: ships (here or in the next sector) take its damage,
+# shields just absorb it
+HIT_TYPES = (COLLISION_TYPES["ship"], COLLISION_TYPES["remote"],
+             COLLISION_TYPES["shield"])
 
 
-class Projectile:
+class Projectiles(ParticlePool):
+    """Every blaster shot in the world.
+
+    Shots are not physics bodies. Each tick they are moved in bulk and a
+    segment query along the path each one just travelled finds what it hit,
+    so fast shots can't tunnel through blocks either.
+    """
     ttl = 100
+    fields = {'positions': ((2,), np.float64),
+              'velocities': ((2,), np.float64),
+              'ttls': ((), np.int32),
+              'damages': ((), np.float64),
+    }
 
-    def __init__(self, source=None, damage=1):
+    def spawn(self, source=None, damage=1):
         source_body = source._body
-        # physics
-        r = 3
-        mass = 0.01
-        inertia = pymunk.moment_for_circle(mass, 0, r)
-        self._body = pymunk.Body(mass, inertia)
-        p = Vec2d(BLOCK_SIZE, 0)
-        p.angle = source_body.angle + math.pi / 2 + source.direction * math.pi / 2
-        self._body.position = source_body.position + p
-        self._body.velocity = source_body.velocity + p * BLOCK_SIZE * 2
-        self._shape = pymunk.Circle(self._body, r)
-        self._shape.collision_type = COLLISION_TYPES["blaster"]
-        self._shape._get_projectile = ref(self)
-        SPACE.add(self._body, self._shape)
-        SPACE.projectiles.add(self)
+        p = source_body.rotation_vector.rotated(
+            math.pi / 2 + source.direction * math.pi / 2) * BLOCK_SIZE
+        position = source_body.position + p
+        velocity = source_body.velocity + p * BLOCK_SIZE * 2
+        i = self._claim()
+        self.positions[i] = position.x, position.y
+        self.velocities[i] = velocity.x, velocity.y
+        self.ttls[i] = self.ttl
+        self.damages[i] = damage
         # SFX
         if settings.SOUND:
-            random.choice(BLASTER_SFX).play()
+            SFX_RANDOM.choice(BLASTER_SFX).play()
+
+    def update(self, dt):
+        if not len(self):
+            return
+        alive = self.alive
+        starts = self.positions[alive]
+        self.velocities[alive] *= SPACE.damping ** dt
+        self.positions[alive] += self.velocities[alive] * dt
+        self.ttls[alive] -= 1
+
+        hit = np.zeros(self.capacity, dtype=bool)
+        for i, start in zip(np.nonzero(alive)[0], starts):
+            shape = self._first_hit(tuple(start), tuple(self.positions[i]))
+            if shape is None:
+                continue
+            hit[i] = True
+            DAMAGE.record(shape, self.damages[i])
+        self._release(hit | (self.ttls < 1))
 
-    def upkeep(self):
-        self.ttl -= 1
-        if self.ttl < 1:
-            SPACE.remove(self._shape, self._body)
-            SPACE.projectiles.remove(self)
+    @staticmethod
+    def _first_hit(start, end):
+        first = None
+        for info in SPACE.segment_query(start, end):
+            if (info.shape.collision_type in HIT_TYPES
+                    and (first is None or info.t < first.t)):
+                first = info
+        if first is not None:
+            return first.shape
 
     def draw(self):
-        p = adjust_for_cam(self._body.position)
+        if not len(self):
+            return
+        points = visible_points(self.drawn_positions(self.alive))
+        if len(points):
+            draw_point_sprites(load_image(BLASTER_IMAGE).id, points,
+                               4 * SPACE.scale)
 
-        gl.glEnable(pyglet.gl.GL_TEXTURE_2D)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, BLASTER_IMAGE.id)
-        gl.glEnable(gl.GL_POINT_SPRITE)
-        gl.glTexEnvi(gl.GL_POINT_SPRITE, gl.GL_COORD_REPLACE, gl.GL_TRUE)
-        gl.glPointSize(4 * SPACE.scale)
 
-        gl.glBegin(gl.GL_POINTS)
-        # TODO: more optimized to draw as one large batch
-        gl.glVertex3f(p.x, p.y, 0)
-        gl.glEnd();
+PROJECTILES = Projectiles()
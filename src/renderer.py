@@ -1,12 +1,40 @@
+import numpy as np
+import pyglet
+import pymunk
 from pymunk.vec2d import Vec2d
 from pyglet import gl
 from space import SPACE
+from atlas import get_atlas, CORNERS
+from materials import COLLISION_TYPES, BLOCK_SIZE, BLOCK_CORNERS
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 700
 SCREEN_CENTER = Vec2d(SCREEN_WIDTH/2, SCREEN_HEIGHT/2)
 SCREEN_BUFFER = 16
 
+# How far outside the screen a block's effects (shields, tractor fields,
+# scanner arrows) can still reach onto it.
+EFFECT_MARGIN = BLOCK_SIZE * 10
+
+# the x and y of each of a block's corners, for turning them all at once
+CORNER_X, CORNER_Y = np.array([tuple(c) for c in BLOCK_CORNERS],
+                              dtype=np.float64).T
+
+CACHED_IMAGES = {}
+
+
+def load_image(filename, anchor=Vec2d(0, 0)):
+    """Loads a texture the first time it is needed so that nothing touches GL
+    until we actually draw.
+    """
+    if filename in CACHED_IMAGES:
+        return CACHED_IMAGES[filename]
+    else:
+        img = pyglet.image.load(filename)
+        img.anchor_x, img.anchor_y = int(anchor.x), int(anchor.y)
+        CACHED_IMAGES[filename] = img.mipmapped_texture
+        return CACHED_IMAGES[filename]
+
 
 def off_screen(point):
     p = adjust_for_cam(point)
@@ -21,14 +49,31 @@ def off_screen(point):
 
 
 def adjust_for_cam(point):
-    return (point - SPACE.last_pos) * SPACE.scale + SCREEN_CENTER
+    return (point - SPACE.view_pos) * SPACE.scale + SCREEN_CENTER
 
 
 def inverse_adjust_for_cam(point):
-    return (point - SCREEN_CENTER) / SPACE.scale + SPACE.last_pos
+    return (point - SCREEN_CENTER) / SPACE.scale + SPACE.view_pos
 
 
-def draw_rect(texture, points, direction=0, use_cam=True):
+def push_camera():
+    """Applies the camera pan and zoom as a single transform, so everything
+    drawn until pop_camera() is given in world coordinates and the GPU does
+    the rest.
+    """
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glPushMatrix()
+    gl.glTranslatef(SCREEN_CENTER.x, SCREEN_CENTER.y, 0)
+    gl.glScalef(SPACE.scale, SPACE.scale, 1)
+    gl.glTranslatef(-SPACE.view_pos.x, -SPACE.view_pos.y, 0)
+
+
+def pop_camera():
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glPopMatrix()
+
+
+def draw_rect(texture, points, direction=0):
     # Set the texture
     gl.glEnable(gl.GL_TEXTURE_2D)
     gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
@@ -38,19 +83,170 @@ def draw_rect(texture, points, direction=0, use_cam=True):
     # draw
     gl.glBegin(gl.GL_QUADS)
     for i, vert in enumerate(points):
-        b = (i + direction) % 4 # render according to the direction
-        if use_cam:
-            x, y = adjust_for_cam(vert)
-        else:
-            x, y = vert
-        texture = b // 2, ((b + 1) // 2) % 2
-        gl.glTexCoord2f(*texture)
-        gl.glVertex3f(x, y, 0)
+        gl.glTexCoord2f(*CORNERS[direction][i])
+        gl.glVertex3f(vert[0], vert[1], 0)
     gl.glEnd()
 
 
-def draw_large_point(texture, p, r):
-    draw_rect(texture, [Vec2d(p.x - r, p.y - r),
-                        Vec2d(p.x + r, p.y - r),
-                        Vec2d(p.x + r, p.y + r),
-                        Vec2d(p.x - r, p.y + r),])
+def draw_quad_arrays(vertices, tex_coords, groups):
+    """Draws quads straight from float32 arrays of shape (n, 4, 2).
+    `groups` is a list of (texture, first, count), each drawn with a single
+    call.
+    """
+    gl.glEnable(gl.GL_TEXTURE_2D)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+    gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+    gl.glVertexPointer(2, gl.GL_FLOAT, 0, vertices.ctypes.data)
+    gl.glTexCoordPointer(2, gl.GL_FLOAT, 0, tex_coords.ctypes.data)
+    for texture, first, count in groups:
+        gl.glBindTexture(gl.GL_TEXTURE_2D, int(texture))
+        gl.glDrawArrays(gl.GL_QUADS, int(first) * 4, int(count) * 4)
+    gl.glDisableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+    gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+
+def draw_point_sprites(texture, points, size):
+    """Draws every point in a float32 array of shape (n, 2) as a sprite `size`
+    pixels across, all in a single call.
+    """
+    gl.glEnable(gl.GL_TEXTURE_2D)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    gl.glEnable(gl.GL_POINT_SPRITE)
+    gl.glTexEnvi(gl.GL_POINT_SPRITE, gl.GL_COORD_REPLACE, gl.GL_TRUE)
+    gl.glPointSize(size)
+    gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+    gl.glVertexPointer(2, gl.GL_FLOAT, 0, points.ctypes.data)
+    gl.glDrawArrays(gl.GL_POINTS, 0, len(points))
+    gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+
+def visible_points(points, margin=SCREEN_BUFFER):
+    """The rows of an (n, 2) array of world positions that are on screen, as
+    a float32 array ready to be drawn.
+    """
+    left, bottom, right, top = visible_bounds(margin)
+    x, y = points[:, 0], points[:, 1]
+    shown = (x > left) & (x < right) & (y > bottom) & (y < top)
+    return np.ascontiguousarray(points[shown], dtype=np.float32)
+
+
+def visible_bounds(margin=SCREEN_BUFFER):
+    """The (left, bottom, right, top) of the screen in world coordinates."""
+    half_w = SCREEN_WIDTH / 2.0 / SPACE.scale + margin
+    half_h = SCREEN_HEIGHT / 2.0 / SPACE.scale + margin
+    x, y = SPACE.view_pos
+    return x - half_w, y - half_h, x + half_w, y + half_h
+
+
+def visible_blocks(margin=EFFECT_MARGIN):
+    """Every block on or near the screen. The space's own spatial index does
+    the searching, so this costs as much as what is on screen rather than
+    the size of the whole world.
+    """
+    left, bottom, right, top = visible_bounds(margin)
+    ship = COLLISION_TYPES['ship']
+    blocks = []
+    for shape in SPACE.bb_query(pymunk.BB(left, bottom, right, top)):
+        if shape.collision_type == ship:
+            block = shape._get_block()
+            if block:
+                blocks.append(block)
+    return blocks
+
+
+class BlockBatch(object):
+    """Draws every block as one quad out of a persistent vertex array.
+
+    Each frame every ship's body is read once, off screen blocks are culled
+    and the corners of the rest are computed in bulk. All block sprites live
+    in the texture atlas, so a whole frame of blocks is a single draw call.
+    """
+
+    def __init__(self, capacity=1024):
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        self.capacity = capacity
+        self._vertices = np.zeros((capacity, 4, 2), dtype=np.float32)
+        self._tex_coords = np.zeros((capacity, 4, 2), dtype=np.float32)
+
+    def draw(self, blocks):
+        atlas = get_atlas()
+        slots = atlas.slots
+        rows = []
+        # blocks of one ship share a body, so each body is only read once,
+        # and moved back to where it was SPACE.lag seconds ago
+        lag = SPACE.lag
+        poses = {}
+        for b in blocks:
+            body = b._shape.body
+            pose = poses.get(body)
+            if pose is None:
+                x, y = body.position - body.velocity * lag
+                pose = poses[body] = (x, y,
+                                      body.angle - body.angular_velocity * lag)
+            ox, oy = b._offset
+            rows.append(pose + (ox, oy, b._local_angle, b.direction,
+                                slots[b.texture]))
+        if not rows:
+            return
+        state = np.array(rows, dtype=np.float64)
+
+        # body position plus the block's offset turned by the body's angle
+        cos, sin = np.cos(state[:, 2]), np.sin(state[:, 2])
+        x = state[:, 0] + state[:, 3] * cos - state[:, 4] * sin
+        y = state[:, 1] + state[:, 3] * sin + state[:, 4] * cos
+        left, bottom, right, top = visible_bounds()
+        shown = (x > left) & (x < right) & (y > bottom) & (y < top)
+        n = int(shown.sum())
+        if not n:
+            return
+        if n > self.capacity:
+            self._grow(max(n, self.capacity * 2))
+
+        x, y, state = x[shown, None], y[shown, None], state[shown]
+        angle = state[:, 2] + state[:, 5]
+        cos = np.cos(angle)[:, None]
+        sin = np.sin(angle)[:, None]
+        cx, cy = CORNER_X, CORNER_Y
+        vertices = self._vertices[:n]
+        vertices[:, :, 0] = x + cx * cos - cy * sin
+        vertices[:, :, 1] = y + cx * sin + cy * cos
+        self._tex_coords[:n] = atlas.tex_coords[state[:, 7].astype(np.intp),
+                                                state[:, 6].astype(np.intp)]
+
+        draw_quad_arrays(self._vertices, self._tex_coords,
+                         [(atlas.texture.id, 0, n)])
+
+
+class QuadBatch(object):
+    """Collects quads in world coordinates, textured with sprites from the
+    atlas, and draws them all at once. Good for things like engine fire and
+    shields that only some blocks draw.
+    """
+
+    def __init__(self):
+        self._points = []
+        self._tex_coords = []
+
+    def add(self, filename, points, direction=0):
+        self._points.append([tuple(p) for p in points])
+        self._tex_coords.append(get_atlas().quad(filename, direction))
+
+    def draw(self):
+        if not self._points:
+            return
+        vertices = np.array(self._points, dtype=np.float32)
+        tex_coords = np.array(self._tex_coords, dtype=np.float32)
+        draw_quad_arrays(vertices, tex_coords,
+                         [(get_atlas().texture.id, 0, len(vertices))])
+        self._points = []
+        self._tex_coords = []
+
+
+BLOCKS = BlockBatch()
+EFFECTS = QuadBatch()
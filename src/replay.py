@@ -0,0 +1,206 @@
+"""Recording a play session and playing it back exactly.
+
+A recording is the seed the random generators started from, where the world
+came from (the default world or a snapshot) and every input the player gave,
+each with the tick it arrived before. The simulation only changes in whole
+ticks and never depends on the wall clock, so seeding the generators the same
+way and giving the same inputs before the same ticks plays the session out
+the same way again, with or without a window, and as fast as the CPU allows.
+
+The checksum of the world at the end is saved with the recording, so a replay
+can tell whether it really did come out the same.
+
+Collisions only come out the same twice when the shapes of blocks are kept
+at the same addresses, so recordings make them in slots (see slots.py),
+which needs pymunk 4.0.0.
+"""
+import hashlib
+import json
+import random
+import numpy as np
+from pymunk.vec2d import Vec2d
+from space import SPACE
+from blocks import Block
+from blockstate import BLOCK_STATE
+from projectiles import PROJECTILES
+from resources import RESOURCES
+from simulation import SIMULATION, populate_world, run_headless
+from shapes import use_slots
+import snapshot
+
+VERSION = 1
+
+# the block columns that make up the checksum
+CHECKED_COLUMNS = ('damage', 'direction', 'exploded', 'on', 'powered',
+                   'active', 'cooldown')
+
+
+def seed(value):
+    """Seeds every random generator the simulation uses."""
+    random.seed(value)
+    np.random.seed(value)
+
+
+def _player():
+    """The player's cockpit, or None once it is gone, even if the garbage
+    collector has not caught up with it yet.
+    """
+    target = SPACE.camera_lock and SPACE.camera_lock()
+    if target and not target.destroyed:
+        return target
+
+
+def key_press(symbol):
+    player = _player()
+    if player:
+        player.on_key_press(symbol)
+
+
+def key_release(symbol):
+    player = _player()
+    if player:
+        player.on_key_release(symbol)
+
+
+def place_block(x, y, angle, welds):
+    """Builds a block at (x, y) welded to the blocks with the ids in
+    `welds`. Raises ValueError, having built nothing, if all of those are
+    gone.
+    """
+    targets = [BLOCK_STATE.blocks[i] for i in welds]
+    targets = [b for b in targets if b is not None]
+    if not targets:
+        raise ValueError("nothing left to weld a block to")
+    block = Block(Vec2d(x, y))
+    block._body.angle = angle
+    for target in targets:
+        block.weld_to(target)
+
+
+# everything the player can do, by the name recordings know it by
+ACTIONS = {'key_press': key_press,
+           'key_release': key_release,
+           'place_block': place_block,
+}
+
+
+def checksum():
+    """A digest of everything that moves or changes in the world: the
+    bodies, the state of their blocks, the projectiles and the resources.
+    """
+    md5 = hashlib.md5()
+    md5.update(str(SIMULATION.ticks))
+    for c in SPACE.constructions:
+        body = c.body
+        md5.update(np.array(tuple(body.position) + (body.angle,) +
+                            tuple(body.velocity) + (body.angular_velocity,),
+                            dtype=np.float64).tostring())
+        ids = np.array([b.id for b in c], dtype=np.intp)
+        md5.update(ids.tostring())
+        for name in CHECKED_COLUMNS:
+            md5.update(getattr(BLOCK_STATE, name)[ids].tostring())
+    for pool, names in ((PROJECTILES, ('positions', 'velocities', 'ttls')),
+                        (RESOURCES, ('positions', 'velocities'))):
+        for name in names:
+            md5.update(np.ascontiguousarray(
+                getattr(pool, name)[pool.alive]).tostring())
+    return md5.hexdigest()
+
+
+class Recording(object):
+    """The inputs of one session. Start it with begin(), then pass every
+    input through give() while it is recorded, or let replay() feed them
+    back.
+    """
+
+    def __init__(self, seed=None, start=None):
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 31)
+        self.seed = seed
+        # the snapshot the session started from, or None for the default
+        # world
+        self.start = start
+        self.events = []
+        self.ticks = 0
+        self.checksum = None
+        # the tick the session started on and the next event to feed
+        self._first_tick = 0
+        self._next = 0
+
+    def begin(self):
+        """Seeds the generators and sets up the world the session starts
+        in, which should be empty.
+        """
+        use_slots()
+        seed(self.seed)
+        if self.start:
+            snapshot.load(self.start)
+        else:
+            populate_world()
+        self._first_tick = SIMULATION.ticks
+        self._next = 0
+
+    def give(self, action, *args):
+        """Carries out the input `action` (a name in ACTIONS) and records
+        it. An input that raises is not recorded, so it cannot fail again
+        when played back.
+        """
+        ACTIONS[action](*args)
+        self.events.append((SIMULATION.ticks - self._first_tick, action,
+                            list(args)))
+
+    def feed(self, tick):
+        """Carries out the inputs that were given before SIMULATION ran tick
+        number `tick` + 1. Set as SIMULATION.replay by play().
+        """
+        tick -= self._first_tick
+        events = self.events
+        while self._next < len(events) and events[self._next][0] <= tick:
+            _, action, args = events[self._next]
+            ACTIONS[action](*args)
+            self._next += 1
+
+    def play(self):
+        """Gives the recorded inputs back to SIMULATION, each before the tick
+        it was given before, from begin() on.
+        """
+        SIMULATION.replay = self.feed
+
+    def finish(self):
+        """Notes how long the session ran and how the world ended up."""
+        self.ticks = SIMULATION.ticks - self._first_tick
+        self.checksum = checksum()
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'version': VERSION, 'seed': self.seed,
+                       'start': self.start, 'ticks': self.ticks,
+                       'checksum': self.checksum, 'events': self.events}, f)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        if data['version'] != VERSION:
+            raise ValueError("{} is a version {} recording, expected {}"
+                             .format(filename, data['version'], VERSION))
+        recording = cls(data['seed'], data['start'])
+        recording.ticks = data['ticks']
+        recording.checksum = data['checksum']
+        recording.events = [(tick, str(action), args)
+                            for tick, action, args in data['events']]
+        return recording
+
+    def replay(self, timings=None):
+        """Plays the whole session back headless, as fast as possible.
+        Returns the wall clock seconds it took and whether the world came
+        out the same as when it was recorded. `timings` is filled in as
+        run_headless() does.
+        """
+        self.begin()
+        self.play()
+        try:
+            elapsed = run_headless(self.ticks, timings)
+        finally:
+            SIMULATION.replay = None
+        return elapsed, checksum() == self.checksum
@@ -1,71 +1,101 @@
 import math
-import pyglet
-import pymunk
+import numpy as np
 import random
 from pymunk.vec2d import Vec2d
-from materials import COLLISION_TYPES
 from space import SPACE
-from weakref import ref
-from pyglet import gl
-from renderer import adjust_for_cam
+from materials import BLOCK_SIZE
+from weakref import WeakSet
+from particles import ParticlePool
+from blockstate import in_order
+from renderer import load_image, draw_point_sprites, visible_points
 
-# TODO: duplicated
-BLOCK_SIZE = 16
+RESOURCE_IMAGE = 'images/iron.png'
 
-RESOURCE_IMAGE = pyglet.image.load('images/iron.png').mipmapped_texture
 
+class Resources(ParticlePool):
+    """Every resource drifting in the world.
 
-class Resource(object):
+    Resources are not physics bodies. Decay, the pull of active tractors and
+    pickup are all worked out for every resource at once each tick.
+    """
     # represents the halflife of the resource object
     decay_chance = 0.00125
+    mass = 0.01
+    fields = {'positions': ((2,), np.float64),
+              'velocities': ((2,), np.float64),
+    }
 
-    def __init__(self, source=None):
-        # physics
-        r = 4
-        mass = 0.01
-        inertia = pymunk.moment_for_circle(mass, 0, r)
-        self._body = pymunk.Body(mass, inertia)
+    def __init__(self, capacity=256):
+        super(Resources, self).__init__(capacity)
+        # TractorBlocks add themselves here while they are active
+        self.tractors = WeakSet()
+
+    def spawn(self, source):
         p = Vec2d(random.uniform(0, BLOCK_SIZE), 0)
         p.rotate(random.uniform(0, 2 * math.pi))
-        self._body.position = source._body.position
-        self._body.velocity = source._body.velocity + p
-        self._shape = pymunk.Circle(self._body, r)
-        self._shape.elasticity = 1.0
-        self._shape.friction= 0.0
-        self._shape.collision_type = COLLISION_TYPES["resource"]
-        self._shape._get_resource = ref(self)
-        self._shape.sensor = True
-        SPACE.add(self._body, self._shape)
-        SPACE.resources.add(self)
+        position = source._body.position
+        velocity = source._body.velocity + p
+        i = self._claim()
+        self.positions[i] = position.x, position.y
+        self.velocities[i] = velocity.x, velocity.y
+
+    def update(self, dt):
+        if not len(self):
+            return
+        live = np.nonzero(self.alive)[0]
+        decayed = np.zeros(self.capacity, dtype=bool)
+        decayed[live] = np.random.random(len(live)) < self.decay_chance
+        self._release(decayed)
+
+        tractors = in_order(t for t in self.tractors if t._active)
+        if tractors:
+            self._tractor_pull(tractors)
+
+        alive = self.alive
+        self.velocities[alive] *= SPACE.damping ** dt
+        self.positions[alive] += self.velocities[alive] * dt
+
+    def _tractor_pull(self, tractors):
+        """Pulls each resource toward the nearest tractor in range, harder
+        the closer it is, and hands resources that arrive to their tractor.
+        """
+        live = np.nonzero(self.alive)[0]
+        centres = np.array([tuple(t._body.position) for t in tractors])
+        radii = np.array([t.radius for t in tractors], dtype=np.float64)
+        # offsets[i, j] points from resource i to tractor j
+        offsets = centres[None, :, :] - self.positions[live][:, None, :]
+        distances = np.hypot(offsets[:, :, 0], offsets[:, :, 1])
+        in_range = distances < radii
+        distances[~in_range] = np.inf
+        nearest = np.argmin(distances, axis=1)
+        rows = np.arange(len(live))
+        pulled = in_range[rows, nearest]
+        live, nearest, rows = live[pulled], nearest[pulled], rows[pulled]
+        distance = distances[rows, nearest]
+
+        picked_up = distance < BLOCK_SIZE / 2
+        for j, count in enumerate(np.bincount(nearest[picked_up],
+                                              minlength=len(tractors))):
+            if count:
+                tractors[j].resource_count += int(count)
+        dead = np.zeros(self.capacity, dtype=bool)
+        dead[live[picked_up]] = True
+        self._release(dead)
 
-    def upkeep(self):
-        if self.decay_chance > random.random():
-            SPACE.remove(self._shape, self._body)
-            SPACE.resources.remove(self)
-        if hasattr(self._shape, "target") and self._shape.target():
-            b = self._shape
-            direction = b.target().position - b.body.position
-            if direction.length < BLOCK_SIZE / 2:
-                block = b.target()._get_block()
-                if block:
-                    block.resource_count += 1
-                SPACE.resources.remove(self)
-            # TODO: 160 is the radius of the field...
-            #       let's get that dynamically
-            direction.length = max(0.1, (160 - direction.length) / 160)
-            b.body.apply_impulse(direction)
-            # TODO: http://chipmunk-physics.net/forum/viewtopic.php?f=1&t=2912
+        keep = ~picked_up
+        live, nearest, rows = live[keep], nearest[keep], rows[keep]
+        distance = distance[keep]
+        strength = np.maximum(0.1, (radii[nearest] - distance) / radii[nearest])
+        direction = offsets[rows, nearest] / distance[:, None]
+        self.velocities[live] += (direction * strength[:, None] / self.mass)
 
     def draw(self):
-        p = adjust_for_cam(self._body.position)
+        if not len(self):
+            return
+        points = visible_points(self.drawn_positions(self.alive))
+        if len(points):
+            draw_point_sprites(load_image(RESOURCE_IMAGE).id, points,
+                               8 * SPACE.scale)
 
-        gl.glEnable(pyglet.gl.GL_TEXTURE_2D)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, RESOURCE_IMAGE.id)
-        gl.glEnable(gl.GL_POINT_SPRITE)
-        gl.glTexEnvi(gl.GL_POINT_SPRITE, gl.GL_COORD_REPLACE, gl.GL_TRUE)
-        gl.glPointSize(8 * SPACE.scale)
 
-        gl.glBegin(gl.GL_POINTS)
-        # TODO: more optimized to draw as one large batch
-        gl.glVertex3f(p.x, p.y, 0)
-        gl.glEnd()
+RESOURCES = Resources()
@@ -0,0 +1,99 @@
+"""Runs the systems that make up a tick, each at its own rate.
+
+Systems register how often they should run and how long one run may take.
+A spread system does not do all of its work in one burst every so often:
+it runs every tick and is told which part of its work is due, so a system
+with a rate of 1/5 s is called as func(dt, part, parts) with parts = 12 and
+handles a twelfth of its entities each tick. A Round hands it the same
+share of a collection whatever is added or removed in the meantime.
+
+Every run is timed, and runs that go over their budget are counted so that
+report() can point at them. Budgets are never enforced by cutting a run
+short: how much work a run does must not depend on how fast the machine is,
+or recordings would not play back the same (see replay.py).
+"""
+from timeit import default_timer
+
+
+class System(object):
+
+    def __init__(self, name, func, every, budget, spread):
+        self.name = name
+        self.func = func
+        self.every = every
+        self.budget = budget
+        self.spread = spread
+        self.calls = 0
+        self.time = 0.0
+        self.overruns = 0
+        self.worst = 0.0
+
+
+class Round(object):
+    """Splits a collection between the runs of a spread system. The items
+    are copied when a round starts (on part 0), and each part is every
+    `parts`th of the copy, so changes on the way cannot shift an item into
+    another part: items added wait for the next round, and items removed
+    from the collection are left out.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self._round = None
+
+    def share(self, part, parts):
+        """The items of part `part` of `parts`."""
+        if part == 0 or self._round is None:
+            self._round = list(self.items)
+        items = self.items
+        return [x for x in self._round[part::parts] if x in items]
+
+
+class Scheduler(object):
+
+    def __init__(self, dt):
+        self.dt = dt
+        self.systems = []
+
+    def add(self, name, func, rate, budget, spread=False):
+        """Registers `func` to run every `rate` seconds, in the order added.
+        `budget` is how many seconds one run may take before it counts as an
+        overrun. Spread systems run every tick on 1 / (rate / dt) of their
+        work instead.
+        """
+        every = max(1, int(round(rate / self.dt)))
+        self.systems.append(System(name, func, every, budget, spread))
+
+    def run(self, tick, timings=None):
+        """Runs everything due on tick number `tick`. If a `timings` dict is
+        given, the seconds each system took are added to it by name.
+        """
+        clock = default_timer
+        for s in self.systems:
+            if s.spread:
+                start = clock()
+                s.func(self.dt, tick % s.every, s.every)
+            elif tick % s.every == 0:
+                start = clock()
+                s.func(self.dt)
+            else:
+                continue
+            elapsed = clock() - start
+            s.calls += 1
+            s.time += elapsed
+            if elapsed > s.budget:
+                s.overruns += 1
+                s.worst = max(s.worst, elapsed)
+            if timings is not None:
+                timings[s.name] = timings.get(s.name, 0.0) + elapsed
+
+    def report(self):
+        """A line for every system that went over its budget."""
+        lines = []
+        for s in self.systems:
+            if s.overruns:
+                lines.append("{}: {} of {} runs over its {:.1f} ms budget "
+                             "(worst {:.1f} ms)".format(
+                                 s.name, s.overruns, s.calls,
+                                 s.budget * 1000, s.worst * 1000))
+        return '\n'.join(lines)
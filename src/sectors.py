@@ -0,0 +1,508 @@
+"""Splitting the world into sectors, each simulated by a process of its own.
+
+One pymunk space only ever steps on one core. To go past that, the world is
+cut into a grid of square sectors, settings.SECTOR_SIZE across, and every
+sector is run by a worker process with its own SPACE and everything else
+simulation.py runs, just as the whole world runs in one process. The
+workers run EXCHANGE_TICKS ticks at a time, all at once, and then report to
+the Universe in the main process, which passes on what has to cross from
+one sector to another:
+
+- Ships whose centre left their sector are handed off: packed up with
+  snapshot.pack(), taken out of the world and unpacked in the sector they
+  moved into. Projectiles and resources that crossed over move the same way.
+- Ships within settings.SECTOR_MARGIN of a sector's edge are copied into the
+  sectors on the other side as ghosts: the shapes of their blocks on a body
+  that only moves where it is told. Ships there bump into them, and shots and
+  explosions that hit them are sent back to the ship's own sector as damage.
+  A ghost does not give way, so ships colliding across a seam each bounce
+  off the other as off a wall.
+- Where the player is, so that sectors the player is not in still centre
+  their level of detail on the player and their AI still has someone to
+  chase.
+
+The grid is centred on the origin. Nothing stops a ship from leaving it;
+it just stays with the sector at the edge.
+"""
+import math
+import multiprocessing
+import time
+import traceback
+from timeit import default_timer
+from weakref import ref
+import numpy as np
+import pymunk
+from space import SPACE
+from blockstate import BLOCK_STATE
+from construction import rebuild_pending
+from damage import DAMAGE, HANDLERS
+from debris import DEBRIS
+from materials import COLLISION_TYPES, BLOCK_SIZE
+from projectiles import PROJECTILES
+from resources import RESOURCES
+from simulation import run_headless, UPDATE_RATE
+import snapshot
+import settings
+
+# ticks every sector runs between two exchanges; ghosts keep drifting the
+# way they last moved in between
+EXCHANGE_TICKS = 4
+# how far past the edge of its sector a ship's centre has to be before it is
+# handed off, so that one sitting on the seam is not passed back and forth
+HANDOFF_SLACK = 64
+# ghosts are all in this group, so that they never collide with each other
+GHOST_GROUP = 1
+
+# what crosses over of projectiles and resources
+POOL_FIELDS = (('projectiles', PROJECTILES,
+                ('positions', 'velocities', 'ttls', 'damages')),
+               ('resources', RESOURCES, ('positions', 'velocities')))
+
+
+class Grid(object):
+    """`columns` x `rows` sectors of `size`, centred on the origin. A sector
+    is known by its (column, row).
+    """
+
+    def __init__(self, columns, rows, size=None):
+        self.columns = columns
+        self.rows = rows
+        self.size = size or settings.SECTOR_SIZE
+        self.left = -columns * self.size / 2.0
+        self.bottom = -rows * self.size / 2.0
+
+    def __iter__(self):
+        return iter([(i, j) for i in range(self.columns)
+                     for j in range(self.rows)])
+
+    def sector_of(self, x, y):
+        i = int(math.floor((x - self.left) / self.size))
+        j = int(math.floor((y - self.bottom) / self.size))
+        return (min(max(i, 0), self.columns - 1),
+                min(max(j, 0), self.rows - 1))
+
+    def sectors_of(self, positions):
+        """The columns and rows of the sectors of an (n, 2) array of
+        positions.
+        """
+        i = np.floor((positions[:, 0] - self.left) / self.size)
+        j = np.floor((positions[:, 1] - self.bottom) / self.size)
+        return (np.clip(i, 0, self.columns - 1).astype(int),
+                np.clip(j, 0, self.rows - 1).astype(int))
+
+    def bounds(self, sector):
+        """(left, bottom, right, top) of `sector`."""
+        i, j = sector
+        left = self.left + i * self.size
+        bottom = self.bottom + j * self.size
+        return left, bottom, left + self.size, bottom + self.size
+
+    def near(self, x, y, margin):
+        """The sectors that (x, y) is in or within `margin` of."""
+        i0, j0 = self.sector_of(x - margin, y - margin)
+        i1, j1 = self.sector_of(x + margin, y + margin)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+
+class Ghost(object):
+    """The copy of a ship from a neighbouring sector. Its body is never added
+    to the space (which leaves Chipmunk to move it only as it is told) and
+    has infinite mass, so that nothing here can push it.
+    """
+
+    def __init__(self, owner, hull, shields):
+        self.body = pymunk.Body(pymunk.inf, pymunk.inf)
+        self.shapes = []
+        for block_id, generation, x, y, elasticity, friction in hull:
+            shape = pymunk.Poly.create_box(self.body, (BLOCK_SIZE, BLOCK_SIZE),
+                                           (x, y))
+            shape.elasticity = elasticity
+            shape.friction = friction
+            shape.collision_type = COLLISION_TYPES['remote']
+            # where to send the damage it takes
+            shape._remote = owner, block_id, generation
+            self.shapes.append(shape)
+        for x, y, radius in shields:
+            shape = pymunk.Circle(self.body, radius, (x, y))
+            shape.elasticity = 0.5
+            shape.collision_type = COLLISION_TYPES['shield']
+            self.shapes.append(shape)
+        for shape in self.shapes:
+            shape.group = GHOST_GROUP
+        SPACE.add(*self.shapes)
+
+    def update(self, x, y, angle, vx, vy, w):
+        body = self.body
+        body.position = x, y
+        body.angle = angle
+        body.velocity = vx, vy
+        body.angular_velocity = w
+
+    def drift(self, dt):
+        """Carries on the way the ship was last seen moving."""
+        body = self.body
+        body.position += body.velocity * dt
+        body.angle += body.angular_velocity * dt
+
+    def remove(self):
+        SPACE.remove(*self.shapes)
+
+
+class RemotePlayer(object):
+    """Stands in for the player's cockpit in the sectors the player is not
+    in, for the AI to chase and the camera to follow.
+    """
+
+    def __init__(self):
+        self._body = pymunk.Body()
+        self.destroyed = True
+
+
+class Sector(object):
+    """The part of the world the worker process it is made in simulates."""
+
+    def __init__(self, grid, key):
+        self.grid = grid
+        self.key = key
+        # by (owning sector, id there of the ship's first block)
+        self.ghosts = {}
+        # the shapes of this sector's ships in the last report, by the id of
+        # their first block, so that they are only sent again once changed
+        self._sent = {}
+        # damage taken by ghosts, for their own sectors to deal
+        self.outbox = []
+        self.player = RemotePlayer()
+        HANDLERS[COLLISION_TYPES['remote']] = self.forward_damage
+
+    def forward_damage(self, events):
+        for shape, amount, impulse in events:
+            owner, block_id, generation = shape._remote
+            self.outbox.append((owner, block_id, generation, amount,
+                                tuple(impulse)))
+
+    def run(self, ticks, arrivals, damage, ghosts, player):
+        """Takes in what the other sectors passed on, runs `ticks` ticks and
+        returns the report for the Universe.
+        """
+        start = time.clock()
+        for arrival in arrivals:
+            self._arrive(arrival)
+        for block_id, generation, amount, impulse in damage:
+            # the block may have been destroyed since, and its row reused
+            if BLOCK_STATE.holds(block_id, generation):
+                DAMAGE.record(BLOCK_STATE.blocks[block_id]._shape, amount,
+                              impulse)
+        self._update_ghosts(ghosts)
+        self._follow(player)
+
+        timings = {}
+        for _ in xrange(ticks):
+            for ghost in self.ghosts.values():
+                ghost.drift(UPDATE_RATE)
+            run_headless(1, timings)
+        return self._report(start, timings)
+
+    def _arrive(self, arrival):
+        if 'constructions' in arrival:
+            snapshot.unpack(arrival['constructions'])
+        for name, pool, _ in POOL_FIELDS:
+            if name in arrival:
+                pool.extend(**arrival[name])
+
+    def _update_ghosts(self, ghosts):
+        """Moves the ghosts to where their ships are now. A ghost whose ship
+        changed shape comes with its new `shape`, (hull, shields); for the
+        rest it is None.
+        """
+        seen = {}
+        for owner, first, x, y, angle, vx, vy, w, shape in ghosts:
+            key = owner, first
+            ghost = self.ghosts.pop(key, None)
+            if shape is not None:
+                if ghost is not None:
+                    ghost.remove()
+                ghost = Ghost(owner, *shape)
+            ghost.update(x, y, angle, vx, vy, w)
+            seen[key] = ghost
+        # the ones not seen any more left the edge or were destroyed
+        for ghost in self.ghosts.values():
+            ghost.remove()
+        self.ghosts = seen
+
+    def _follow(self, player):
+        target = SPACE.camera_lock and SPACE.camera_lock()
+        if target is not None and target is not self.player:
+            if not target.destroyed:
+                return
+        if player is not None:
+            self.player._body.position = player
+            self.player.destroyed = False
+        else:
+            self.player.destroyed = True
+        SPACE.camera_lock = ref(self.player)
+
+    def _report(self, start, timings):
+        rebuild_pending()
+        left, bottom, right, top = self.grid.bounds(self.key)
+        slack = HANDOFF_SLACK
+        margin = settings.SECTOR_MARGIN
+        leaving = {}
+        ghosts = []
+        sent = {}
+        for c in list(SPACE.constructions):
+            x, y = c.body.position
+            if not (left - slack <= x <= right + slack and
+                    bottom - slack <= y <= top + slack):
+                sector = self.grid.sector_of(x, y)
+                if sector != self.key:
+                    leaving.setdefault(sector, []).append(c)
+                    continue
+            if (not (left + margin <= x <= right - margin and
+                     bottom + margin <= y <= top - margin)
+                    and len(self.grid.near(x, y, margin)) > 1):
+                ghost = self._ghost_of(c)
+                if ghost is None:
+                    continue
+                first, shape = ghost[0], ghost[-1]
+                if self._sent.get(first) == shape:
+                    ghost = ghost[:-1] + (None,)
+                sent[first] = shape
+                ghosts.append(ghost)
+        self._sent = sent
+
+        arrivals = {}
+        for sector, constructions in leaving.items():
+            arrivals[sector] = {'constructions': snapshot.pack(constructions)}
+            for c in constructions:
+                c.remove()
+        for name, pool, fields in POOL_FIELDS:
+            for sector, columns in self._emigrate(pool, fields).items():
+                arrivals.setdefault(sector, {})[name] = columns
+
+        target = SPACE.camera_lock and SPACE.camera_lock()
+        player = None
+        if (target is not None and target is not self.player
+                and not target.destroyed):
+            player = tuple(target._body.position)
+
+        counts = DEBRIS.counts()
+        counts['blocks'] = len(SPACE.blocks)
+        counts['bodies'] = len(SPACE.bodies)
+        counts['ghosts'] = len(self.ghosts)
+        damage, self.outbox = self.outbox, []
+        # CPU time, since the sectors may be sharing cores
+        return {'elapsed': time.clock() - start, 'timings': timings, 'counts': counts,
+                'arrivals': arrivals, 'ghosts': ghosts, 'damage': damage,
+                'player': player}
+
+    @staticmethod
+    def _ghost_of(c):
+        """What the neighbours need to know to copy `c`, or None if none
+        of its blocks are left to bump into.
+        """
+        body = c.body
+        hull = []
+        shields = []
+        for b in c:
+            if b.has_exploded:
+                continue
+            x, y = b._offset
+            hull.append((b.id, b._generation, x, y, b.material.elasticity,
+                         b.material.friction))
+            if getattr(b, '_shield_shape', None) is not None:
+                shields.append((x, y, b.radius))
+        if not hull:
+            return None
+        x, y = body.position
+        vx, vy = body.velocity
+        return (hull[0][0], x, y, body.angle, vx, vy,
+                body.angular_velocity, (hull, shields))
+
+    def _emigrate(self, pool, fields):
+        """Takes what has left this sector out of `pool` and returns its
+        columns by the sector it went to.
+        """
+        alive = np.nonzero(pool.alive)[0]
+        if not len(alive):
+            return {}
+        i, j = self.grid.sectors_of(pool.positions[alive])
+        away = (i != self.key[0]) | (j != self.key[1])
+        if not away.any():
+            return {}
+        columns = {}
+        for sector in set(zip(i[away].tolist(), j[away].tolist())):
+            rows = alive[(i == sector[0]) & (j == sector[1])]
+            columns[sector] = dict((name, getattr(pool, name)[rows])
+                                   for name in fields)
+        gone = np.zeros(pool.capacity, dtype=bool)
+        gone[alive[away]] = True
+        pool._release(gone)
+        return columns
+
+
+def _serve(conn, grid, key):
+    """What a worker process does: runs its sector a round at a time, when
+    told to, until told to stop.
+    """
+    sector = Sector(grid, key)
+    while True:
+        message = conn.recv()
+        if message[0] == 'stop':
+            break
+        try:
+            conn.send(sector.run(*message[1:]))
+        except Exception:
+            conn.send({'error': traceback.format_exc()})
+
+
+class Universe(object):
+    """A world split over a `columns` x `rows` grid of sectors, a worker
+    process each.
+
+    The workers are started straight away, while the world in this process
+    is still empty, so that each starts out empty too. Then build the world
+    here as usual and distribute() it, and run() the sectors.
+    """
+
+    def __init__(self, columns, rows):
+        self.grid = Grid(columns, rows)
+        self.workers = {}
+        for key in self.grid:
+            ours, theirs = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve,
+                                              args=(theirs, self.grid, key))
+            process.daemon = True
+            process.start()
+            self.workers[key] = process, ours
+        self.player = None
+        # what each sector gets next round
+        self._arrivals = dict((key, []) for key in self.grid)
+        self._damage = dict((key, []) for key in self.grid)
+        self._ghosts = dict((key, []) for key in self.grid)
+        # the latest shape of every ghost, as (version, shape), and the
+        # version each sector was last sent, by (owning sector, first id)
+        self._shapes = {}
+        self._known = dict((key, {}) for key in self.grid)
+        self._version = 0
+        # the last counts each sector reported
+        self.counts = {}
+        # seconds the sectors spent on their rounds, all of them and only
+        # the busiest sector of each round
+        self.busy = 0.0
+        self.busiest = 0.0
+
+    def distribute(self):
+        """Hands everything in this process's world out to the sectors it is
+        in, leaving it empty.
+        """
+        rebuild_pending()
+        target = SPACE.camera_lock and SPACE.camera_lock()
+        if target is not None:
+            self.player = tuple(target._body.position)
+        by_sector = {}
+        for c in list(SPACE.constructions):
+            by_sector.setdefault(self.grid.sector_of(*c.body.position),
+                                 []).append(c)
+        for sector, constructions in by_sector.items():
+            self._arrivals[sector].append(
+                {'constructions': snapshot.pack(constructions)})
+            for c in constructions:
+                c.remove()
+        for name, pool, fields in POOL_FIELDS:
+            alive = np.nonzero(pool.alive)[0]
+            if not len(alive):
+                continue
+            i, j = self.grid.sectors_of(pool.positions[alive])
+            for sector in set(zip(i.tolist(), j.tolist())):
+                rows = alive[(i == sector[0]) & (j == sector[1])]
+                self._arrivals[sector].append(
+                    {name: dict((field, getattr(pool, field)[rows])
+                                for field in fields)})
+            pool._release(pool.alive.copy())
+
+    def run(self, ticks, timings=None):
+        """Runs `ticks` ticks in every sector. If a `timings` dict is given,
+        the seconds each sector spent in each of simulation.TIMED_SYSTEMS
+        are added to it. Returns the wall clock seconds spent.
+        """
+        start = default_timer()
+        while ticks > 0:
+            self._round(min(ticks, EXCHANGE_TICKS), timings)
+            ticks -= EXCHANGE_TICKS
+        return default_timer() - start
+
+    def _round(self, ticks, timings):
+        for key, (_, conn) in self.workers.items():
+            conn.send(('run', ticks, self._arrivals[key], self._damage[key],
+                       self._ghosts[key], self.player))
+            self._arrivals[key] = []
+            self._damage[key] = []
+            self._ghosts[key] = []
+
+        player = None
+        shapes = {}
+        ghosts = []
+        longest = 0.0
+        for key in sorted(self.workers):
+            report = self.workers[key][1].recv()
+            if 'error' in report:
+                raise RuntimeError("sector {} failed:\n{}".format(
+                    key, report['error']))
+            for sector, arrival in report['arrivals'].items():
+                self._arrivals[sector].append(arrival)
+            for damage in report['damage']:
+                self._damage[damage[0]].append(damage[1:])
+            for ghost in report['ghosts']:
+                name = key, ghost[0]
+                if ghost[-1] is None:
+                    shapes[name] = self._shapes[name]
+                else:
+                    self._version += 1
+                    shapes[name] = self._version, ghost[-1]
+                ghosts.append((key,) + ghost[:-1])
+            if report['player'] is not None:
+                player = report['player']
+            if timings is not None:
+                for name, seconds in report['timings'].items():
+                    timings[name] = timings.get(name, 0.0) + seconds
+            self.counts[key] = report['counts']
+            self.busy += report['elapsed']
+            longest = max(longest, report['elapsed'])
+        self.busiest += longest
+        self.player = player
+        self._shapes = shapes
+        self._route_ghosts(ghosts)
+
+    def _route_ghosts(self, ghosts):
+        """Passes the ghosts on to the sectors near them, with their shapes
+        only where the sector has not got that shape yet.
+        """
+        margin = settings.SECTOR_MARGIN
+        known = dict((key, {}) for key in self.grid)
+        for ghost in ghosts:
+            name = ghost[:2]
+            version, shape = self._shapes[name]
+            for sector in self.grid.near(ghost[2], ghost[3], margin):
+                if sector == name[0]:
+                    continue
+                if self._known[sector].get(name) == version:
+                    self._ghosts[sector].append(ghost + (None,))
+                else:
+                    self._ghosts[sector].append(ghost + (shape,))
+                known[sector][name] = version
+        # a sector drops the ghosts it is not sent
+        self._known = known
+
+    def totals(self):
+        """The counts of every sector added up."""
+        totals = {}
+        for counts in self.counts.values():
+            for name, n in counts.items():
+                totals[name] = totals.get(name, 0) + n
+        return totals
+
+    def close(self):
+        for process, conn in self.workers.values():
+            conn.send(('stop',))
+        for process, conn in self.workers.values():
+            process.join()
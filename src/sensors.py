@@ -0,0 +1,80 @@
+"""Answers questions like "which reactors are within R of P".
+
+The positions of everything that can be sensed are indexed at most once per
+tick, the first time anyone asks. Queries are answered from cells of the
+world as wide as their radius: the first query in a cell picks out everything
+that could be in range of any point in it, and that is cached until the next
+tick, so every other scanner in the cell only measures distances to those.
+"""
+import numpy as np
+from space import SPACE
+
+
+class SortedIndex(object):
+    """Objects sorted by the x of their body's position, so that a radius
+    query only has to look at the slice of them whose x is in range.
+    """
+
+    def __init__(self, objects):
+        positions = np.array([tuple(o._body.position) for o in objects],
+                             dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(positions[:, 0], kind='mergesort')
+        self.objects = [objects[i] for i in order]
+        self.positions = positions[order]
+
+    def within(self, left, bottom, right, top):
+        """Returns (objects, positions) for everything inside the box."""
+        xs = self.positions[:, 0]
+        lo = np.searchsorted(xs, left, side='left')
+        hi = np.searchsorted(xs, right, side='right')
+        ys = self.positions[lo:hi, 1]
+        inside = np.nonzero((ys >= bottom) & (ys <= top))[0]
+        return ([self.objects[lo + i] for i in inside],
+                self.positions[lo:hi][inside])
+
+
+class Sensors(object):
+
+    def __init__(self):
+        self._indexes = None
+        self._cache = {}
+
+    def invalidate(self):
+        """Forgets everything; called once per tick after the world moved."""
+        self._indexes = None
+        self._cache.clear()
+
+    def _build(self):
+        reactors = [b for b in SPACE.reactors if not b.has_exploded]
+        self._indexes = {'reactors': SortedIndex(reactors)}
+
+    def _candidates(self, kind, point, radius):
+        """Everything of `kind` within `radius` of any point in the cell
+        `point` is in, from the cache when another query already asked.
+        """
+        i, j = int(point[0] // radius), int(point[1] // radius)
+        key = (kind, radius, i, j)
+        if key not in self._cache:
+            if self._indexes is None:
+                self._build()
+            self._cache[key] = self._indexes[kind].within(
+                (i - 1) * radius, (j - 1) * radius,
+                (i + 2) * radius, (j + 2) * radius)
+        return self._cache[key]
+
+    def _query(self, kind, point, radius):
+        """Returns (objects, offsets from point, distances) for everything
+        of `kind` within radius of point.
+        """
+        objects, positions = self._candidates(kind, point, radius)
+        offsets = positions - (point[0], point[1])
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        inside = np.nonzero(distances <= radius)[0]
+        return [objects[i] for i in inside], offsets[inside], distances[inside]
+
+    def reactors_near(self, point, radius):
+        """Working reactors within radius of point."""
+        return self._query('reactors', point, radius)
+
+
+SENSORS = Sensors()
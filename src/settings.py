@@ -1 +1,30 @@
 SOUND = True
+
+# Bodies moving slower than SLEEP_SPEED (units per second) for SLEEP_TIME
+# seconds fall asleep and cost nothing until something touches or pushes them.
+SLEEP_TIME = 0.5
+SLEEP_SPEED = 4
+
+# Simulation level of detail, by distance from the camera. Constructions
+# within LOD_ACTIVE_RADIUS are fully simulated. Beyond it they still drift and
+# collide but their blocks and AI stop running, and beyond LOD_FREEZE_RADIUS
+# they are frozen in place until the camera comes back.
+LOD_ACTIVE_RADIUS = 6000
+LOD_FREEZE_RADIUS = 12000
+
+# AI cockpits further than this from the player only think on every
+# AI_FAR_INTERVAL'th of their turns.
+AI_NEAR_RADIUS = 3000
+AI_FAR_INTERVAL = 4
+
+# The most wrecked blocks left drifting around at once. Past this the ones
+# beyond LOD_ACTIVE_RADIUS vanish first, then the oldest break up into
+# resources.
+MAX_DEBRIS = 200
+
+# When the world is split into sectors, each simulated by a process of its own
+# (see src/sectors.py), each sector is a square SECTOR_SIZE across. Ships
+# within SECTOR_MARGIN of a sector's edge are copied into the sectors on the
+# other side, so that they can still collide and be shot across it.
+SECTOR_SIZE = 4000
+SECTOR_MARGIN = 512
@@ -0,0 +1,34 @@
+"""Making the shapes of blocks.
+
+Plain pymunk shapes are used unless use_slots() has been called, after which
+every block shape is made at an address that follows its block's id, so that
+collisions come out exactly the same every run (see slots.py). Recordings
+need that to play back the same; nothing else does.
+"""
+import pymunk
+
+# slots.py, once use_slots() has been called
+_slots = None
+
+
+def use_slots():
+    """Makes every block shape from now on in its block's slot. Call it while
+    there are no blocks yet.
+    """
+    global _slots
+    import slots
+    _slots = slots
+
+
+def hull_shape(block_id, body, vertices):
+    """The hull of block `block_id`: a polygon on `body`."""
+    if _slots:
+        return _slots.BlockPoly(block_id, body, vertices)
+    return pymunk.Poly(body, vertices)
+
+
+def shield_shape(block_id, body, radius, offset):
+    """The shield bubble of block `block_id`: a circle on `body`."""
+    if _slots:
+        return _slots.BlockCircle(block_id, body, radius, offset)
+    return pymunk.Circle(body, radius, offset)
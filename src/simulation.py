@@ -0,0 +1,257 @@
+"""Everything needed to run the game world, without any windowing or drawing.
+
+The world only ever moves in fixed ticks of UPDATE_RATE seconds, so it
+behaves the same however fast it is drawn. main.py feeds the time between
+frames to SIMULATION.advance(), which runs as many ticks as are due;
+headless.py runs ticks back to back as fast as the CPU allows.
+"""
+import random
+from timeit import default_timer
+from pymunk.vec2d import Vec2d
+from space import SPACE
+from blocks import EngineBlock
+from blueprints import spawn_ship
+from materials import COLLISION_TYPES
+from particles import EXPLOSION_EFFECTS
+from projectiles import PROJECTILES
+from damage import DAMAGE
+from debris import DEBRIS
+from resources import RESOURCES
+from sensors import SENSORS
+from scheduler import Scheduler, Round
+from construction import rebuild_pending, ACTIVE, COASTING, FROZEN
+from blockstate import BLOCK_STATE
+import power
+import ai
+import settings
+
+# how often (in seconds) each part of the simulation runs; AI, power and LOD
+# are spread out, doing a share of their work every tick
+UPDATE_RATE = 1.0 / 60.0
+AI_RATE = 1.0 / 20.0
+POWER_RATE = 1.0 / 5.0
+LOD_RATE = 1.0 / 2.0
+DEBRIS_RATE = 1.0
+
+# how long (in seconds) one run of each part may take before the scheduler
+# counts it as an overrun; runs are never cut short, see scheduler
+UPDATE_BUDGET = 0.004
+STEP_BUDGET = 0.008
+AI_BUDGET = 0.002
+POWER_BUDGET = 0.001
+LOD_BUDGET = 0.001
+DEBRIS_BUDGET = 0.001
+
+# The most ticks one frame may run. A frame slower than this drops the rest of
+# its time, so a hitch slows the game down instead of making every following
+# frame run even more ticks to catch up.
+MAX_TICKS_PER_FRAME = 5
+
+# the parts of a tick that run_headless() keeps separate timings for
+TIMED_SYSTEMS = ('update', 'step', 'tick_ai', 'tick_power', 'tick_lod',
+                 'tick_debris')
+
+
+def populate_world():
+    """Spawns the player and the default set of enemies and asteroids."""
+    spawn_ship('fighter.ship', Vec2d(0, 0), player_controlled=True)
+    for i in range(5):
+        spawn = 3000
+        #spawn_ship('frigate.ship', Vec2d(random.randint(-spawn, spawn),
+        #                                 random.randint(-spawn, spawn)))
+        #spawn_ship('trident.ship', Vec2d(random.randint(-spawn, spawn),
+        #                                random.randint(-spawn, spawn)))
+        #spawn_ship('lander.ship', Vec2d(random.randint(-spawn, spawn),
+        #                                random.randint(-spawn, spawn)))
+        spawn_ship('mini.ship', Vec2d(random.randint(-spawn, spawn),
+                                        random.randint(-spawn, spawn)))
+    for i in range(5):
+        spawn = 3000
+        spawn_ship('asteroid.ship', Vec2d(random.randint(-spawn, spawn),
+                                          random.randint(-spawn, spawn)))
+
+
+def nocollide(space, arbiter):
+    return False
+
+
+def upkeep(dt):
+    """Everything update() does before stepping the physics."""
+    # blocks destroyed last tick give up their rows
+    BLOCK_STATE.recycle()
+    # give ships welded together since last tick their new bodies
+    rebuild_pending()
+    EngineBlock.reset_thrust()
+    # only blocks on ACTIVE constructions switch or run
+    BLOCK_STATE.tick_cooldowns()
+    starting, stopping = BLOCK_STATE.switching()
+    for b in starting:
+        b.activate()
+        b._active = True
+    for b in stopping:
+        b.deactivate()
+        b._active = False
+    [b._upkeep() for b in BLOCK_STATE.running()]
+    # update scale smoothly
+    SPACE.scale += (SPACE.target_scale - SPACE.scale) * .25
+    # upkeep on various entities
+    PROJECTILES.update(dt)
+    RESOURCES.update(dt)
+    EXPLOSION_EFFECTS.update(dt)
+
+
+def after_step():
+    """Everything update() does once the physics has moved the world."""
+    SENSORS.invalidate()
+    follow_camera()
+
+
+def follow_camera():
+    # Update the camera's last valid position
+    target = SPACE.camera_lock and SPACE.camera_lock()
+    if target:
+        SPACE.last_pos = Vec2d(target._body.position)
+
+
+def step(dt):
+    SPACE.step(dt)
+    # everything that got hit during the tick takes its damage now that the
+    # physics is done with it
+    DAMAGE.resolve()
+    after_step()
+
+
+# the cockpits and constructions split between the runs of tick_ai and
+# tick_lod
+AI_ROUND = Round(SPACE.cockpits)
+LOD_ROUND = Round(SPACE.constructions)
+
+
+def tick_ai(dt, part=0, parts=1):
+    """Thinks for every `parts`th AI cockpit, starting at `part`."""
+    ai.think([b for b in AI_ROUND.share(part, parts)
+              if b.ai and b._construction.lod == ACTIVE])
+
+
+def tick_power(dt, part=0, parts=1):
+    """Solves this tick's share of the dirty power grids: the ones left
+    are shared out over the runs left in the round, so every grid dirtied
+    before a round starts is solved by the end of it.
+    """
+    power.solve_dirty(-(-power.pending() // (parts - part)))
+
+
+def tick_lod(dt, part=0, parts=1):
+    """Decides how much of the simulation each construction gets by its
+    distance from the camera: ACTIVE ones run fully, COASTING ones only drift
+    and collide, and FROZEN ones are put to sleep until the camera is back in
+    range or something hits them. See the LOD radii in settings. Looks at
+    every `parts`th construction, starting at `part`.
+    """
+    centre = SPACE.last_pos
+    active = settings.LOD_ACTIVE_RADIUS ** 2
+    frozen = settings.LOD_FREEZE_RADIUS ** 2
+    for c in LOD_ROUND.share(part, parts):
+        body = c.body
+        d = (body.position - centre).get_length_sqrd()
+        lod = FROZEN if d > frozen else COASTING if d > active else ACTIVE
+        if lod == FROZEN:
+            if not body.is_sleeping:
+                body.sleep()
+        elif c.lod == FROZEN:
+            body.activate()
+        c.lod = lod
+
+
+def tick_debris(dt):
+    """Clears away wreckage over settings.MAX_DEBRIS."""
+    DEBRIS.trim()
+
+
+class FixedTimestep(object):
+    """Runs the simulation in ticks of exactly `dt` seconds.
+
+    Every tick runs the systems in `scheduler`: upkeep and the physics step,
+    then this tick's share of AI, power and LOD, and now and then a clear out
+    of the debris. Frames hand their elapsed time to advance(), which keeps
+    the remainder that did not make up a whole tick for the next frame and
+    sets SPACE.lag so that the frame is drawn part way between the last two
+    ticks.
+
+    While a recording is played back (see replay.py), `replay` is called with
+    the number of ticks run so far before every tick, to give the inputs that
+    arrived before it.
+    """
+
+    def __init__(self, dt=UPDATE_RATE, max_ticks=MAX_TICKS_PER_FRAME):
+        self.dt = dt
+        self.max_ticks = max_ticks
+        self.ticks = 0
+        self.replay = None
+        self.accumulator = 0.0
+        self.dropped = 0.0 # seconds skipped by frames that ran too long
+        self.scheduler = Scheduler(dt)
+        self.scheduler.add('update', upkeep, dt, UPDATE_BUDGET)
+        self.scheduler.add('step', step, dt, STEP_BUDGET)
+        self.scheduler.add('tick_ai', tick_ai, AI_RATE, AI_BUDGET,
+                           spread=True)
+        self.scheduler.add('tick_power', tick_power, POWER_RATE, POWER_BUDGET,
+                           spread=True)
+        self.scheduler.add('tick_lod', tick_lod, LOD_RATE, LOD_BUDGET,
+                           spread=True)
+        self.scheduler.add('tick_debris', tick_debris, DEBRIS_RATE,
+                           DEBRIS_BUDGET)
+
+    def tick(self, timings=None):
+        """Runs one tick. If a `timings` dict is given, the seconds spent in
+        each of TIMED_SYSTEMS are added to it.
+        """
+        if self.replay is not None:
+            self.replay(self.ticks)
+        self.ticks += 1
+        self.scheduler.run(self.ticks, timings)
+
+    def advance(self, elapsed):
+        """Runs the ticks due after `elapsed` more seconds of wall clock."""
+        self.accumulator += elapsed
+        ran = 0
+        while self.accumulator >= self.dt:
+            if ran == self.max_ticks:
+                self.dropped += self.accumulator - self.accumulator % self.dt
+                self.accumulator %= self.dt
+                break
+            self.tick()
+            self.accumulator -= self.dt
+            ran += 1
+        # draw the world as it was between the last two ticks
+        SPACE.lag = self.dt - self.accumulator
+        if SPACE.camera_lock and SPACE.camera_lock():
+            SPACE.view_pos = SPACE.camera_lock()._body.drawn_position
+        else:
+            SPACE.view_pos = SPACE.last_pos
+
+
+SIMULATION = FixedTimestep()
+
+
+def run_headless(ticks, timings=None):
+    """Runs `ticks` ticks back to back, never sleeping. If a `timings` dict
+    is given, the seconds spent in each of TIMED_SYSTEMS are added to it.
+    Returns the wall clock seconds spent.
+    """
+    if timings is not None:
+        for name in TIMED_SYSTEMS:
+            timings.setdefault(name, 0.0)
+    start = default_timer()
+    for _ in xrange(ticks):
+        SIMULATION.tick(timings)
+    return default_timer() - start
+
+
+# INITIALIZE SPACE
+def collide(t1, t2, func):
+    SPACE.add_collision_handler(COLLISION_TYPES[t1], COLLISION_TYPES[t2],
+                                begin=func)
+
+collide('shield', 'ship', nocollide)
+collide('shield', 'remote', nocollide)
@@ -0,0 +1,120 @@
+"""Block shapes kept at addresses that follow the block ids.
+
+When two shapes of the same kind touch, Chipmunk puts whichever sits lower
+in memory first in the collision. Which one comes first changes the last
+bits of the result, and since malloc hands out different addresses every
+run, collisions between ships would never come out quite the same twice.
+So the shapes of blocks are not malloced: they live in one array, reserved
+up front but only paged in as it is used, each at a slot given by its
+block's id. The hull of block `id` is in slot 2 * id and its shield bubble in
+slot 2 * id + 1, so collisions always put the lower id first.
+
+A slot holds one shape at a time. Making a block's new shape (when it moves
+onto another body, say) takes the slot over from the old one, which must be
+out of the space by then. The rows of destroyed blocks, and so their ids, are
+reused (see blockstate), so MAX_BLOCKS limits the blocks in the world at once.
+
+Shapes are set up here the way pymunk would, through its internals, so this
+only works with pymunk 4.0.0. Nothing imports it until shapes.use_slots() is
+called, which only recordings and their replays do.
+"""
+import ctypes as ct
+import mmap
+from weakref import ref
+import pymunk
+
+PYMUNK_VERSION = '4.0.0'
+if pymunk.version != PYMUNK_VERSION:
+    raise ImportError("block shape slots need pymunk {}, not {}".format(
+        PYMUNK_VERSION, pymunk.version))
+import pymunk._chipmunk as cp
+
+# the most blocks there can be at once
+MAX_BLOCKS = 1 << 18
+SLOT_SIZE = max(ct.sizeof(cp.cpPolyShape), ct.sizeof(cp.cpCircleShape))
+
+
+class ShapeSlots(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        size = capacity * SLOT_SIZE
+        if hasattr(mmap, 'MAP_PRIVATE'):
+            # private, so that processes forked from this one (see
+            # sectors.py) each get their own copy
+            self._memory = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE)
+        else:
+            # Windows, where processes are never forked
+            self._memory = mmap.mmap(-1, size)
+        self._base = ct.addressof(ct.c_char.from_buffer(self._memory))
+        # a weak reference to the shape in each slot in use, by slot
+        self._owners = {}
+
+    def claim(self, slot, shape, struct):
+        """Hands `slot` to `shape`, destroying the shape that had it, and
+        returns a pointer to it as a `struct`.
+        """
+        if slot >= self.capacity:
+            raise RuntimeError("out of block shape slots, there can be at "
+                               "most {} blocks at once".format(MAX_BLOCKS))
+        owner = self._owners.pop(slot, None)
+        old = owner and owner()
+        if old is not None:
+            # Chipmunk would go on using a shape destroyed in the space
+            assert not old._shape.contents.space_private, \
+                "block shape slot {} taken over while in the space".format(slot)
+            cp.cpShapeDestroy(old._shape)
+        self._owners[slot] = ref(shape)
+        return ct.cast(self._base + slot * SLOT_SIZE, ct.POINTER(struct))
+
+    def release(self, slot, shape):
+        """Destroys `shape` if it still has `slot`. A shape being deleted
+        can no longer be reached through its weak reference, so a dead one
+        counts as `shape` too.
+        """
+        owner = self._owners.get(slot)
+        if owner is None or owner() not in (None, shape):
+            return
+        del self._owners[slot]
+        cp.cpShapeDestroy(shape._shape)
+
+
+SLOTS = ShapeSlots(MAX_BLOCKS * 2)
+
+
+class BlockPoly(pymunk.Poly):
+    """A block's hull, in slot 2 * `block_id`."""
+
+    def __init__(self, block_id, body, vertices):
+        slot = 2 * block_id
+        self._slot = slot
+        struct = SLOTS.claim(slot, self, cp.cpPolyShape)
+        self._body = body
+        self.offset = (0, 0)
+        self._set_verts(vertices)
+        body._shapes.add(self)
+        cp.cpPolyShapeInit2(struct, body._body, len(vertices), self.verts,
+                            self.offset, 0)
+        self._shape = ct.cast(struct, ct.POINTER(cp.cpShape))
+        self._shapecontents = self._shape.contents
+
+    def __del__(self):
+        SLOTS.release(self._slot, self)
+
+
+class BlockCircle(pymunk.Circle):
+    """A block's shield bubble, in slot 2 * `block_id` + 1."""
+
+    def __init__(self, block_id, body, radius, offset):
+        slot = 2 * block_id + 1
+        self._slot = slot
+        struct = SLOTS.claim(slot, self, cp.cpCircleShape)
+        self._body = body
+        body._shapes.add(self)
+        cp.cpCircleShapeInit(struct, body._body, radius, offset)
+        self._shape = ct.cast(struct, ct.POINTER(cp.cpShape))
+        self._shapecontents = self._shape.contents
+        self._cs = struct
+
+    def __del__(self):
+        SLOTS.release(self._slot, self)
@@ -0,0 +1,235 @@
+"""Saving the whole world to a file and loading it back.
+
+A snapshot is a numpy .npz file of flat arrays: one row per body, one per
+block (its type as the letter ship files use, its body, where it sits on the
+body and everything BLOCK_STATE knows about it), the welds and cockpit
+controls as pairs of block rows, and the projectiles and resources. Both
+saving and loading work on whole arrays at once, so even a world of
+thousands of ships loads quickly.
+
+Explosion animations and anything else that is only drawn are not saved.
+Blocks come back switched on or off as they were and start running again on
+the first tick.
+
+pack() and unpack() do the same for just some of the constructions, which is
+how ships move between sector processes (see sectors.py).
+"""
+import gc
+import numpy as np
+import pymunk
+from pymunk.vec2d import Vec2d
+from weakref import ref
+from space import SPACE
+from blocks import CockpitBlock
+from blockstate import BLOCK_STATE
+from blueprints import BLOCK_MAP
+from construction import Construction, rebuild_pending, FROZEN
+from debris import DEBRIS
+from projectiles import PROJECTILES
+from resources import RESOURCES
+from simulation import SIMULATION
+
+VERSION = 1
+
+TYPE_CODES = dict((cls, code) for code, cls in BLOCK_MAP.items())
+BINDING_TYPES = ('toggle', 'mirror', 'inverted')
+# the block columns kept as they are in BLOCK_STATE
+STATE_COLUMNS = ('direction', 'damage', 'exploded', 'on', 'powered',
+                 'priority', 'power_used', 'cooldown')
+
+
+def _tristate(value):
+    return -1 if value is None else int(value)
+
+
+def _from_tristate(value):
+    return None if value < 0 else bool(value)
+
+
+def save(filename):
+    """Writes every construction, projectile and resource in the world to
+    `filename`.
+    """
+    rebuild_pending()
+    constructions = sorted(set(b._construction for b in SPACE.blocks),
+                           key=lambda c: min(b.id for b in c))
+    arrays = pack(constructions)
+    arrays['version'] = np.array(VERSION)
+    arrays['tick'] = np.array(SIMULATION.ticks)
+    arrays['view'] = np.array(tuple(SPACE.last_pos) +
+                              (SPACE.scale, SPACE.target_scale))
+    for pool, prefix, names in ((PROJECTILES, 'projectile_',
+                                 ('positions', 'velocities', 'ttls',
+                                  'damages')),
+                                (RESOURCES, 'resource_',
+                                 ('positions', 'velocities'))):
+        for name in names:
+            arrays[prefix + name] = getattr(pool, name)[pool.alive]
+
+    with open(filename, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def pack(constructions):
+    """The arrays that describe `constructions`, which must have been
+    rebuilt, and everything on them.
+    """
+    blocks = []
+    block_bodies = []
+    bodies = []
+    lods = []
+    for n, c in enumerate(constructions):
+        body = c.body
+        bodies.append(tuple(body.position) + (body.angle,) +
+                      tuple(body.velocity) +
+                      (body.angular_velocity, body.mass, body.moment))
+        lods.append(c.lod)
+        members = sorted(c.blocks, key=lambda b: b.id)
+        blocks.extend(members)
+        block_bodies.extend([n] * len(members))
+    index = dict((b, i) for i, b in enumerate(blocks))
+    ids = np.array([b.id for b in blocks], dtype=np.intp)
+
+    arrays = {
+        'bodies': np.array(bodies, dtype=np.float64).reshape(-1, 8),
+        'lods': np.array(lods, dtype=np.int8),
+        'types': np.array([TYPE_CODES[type(b)] for b in blocks], dtype='S1'),
+        'block_bodies': np.array(block_bodies, dtype=np.int32),
+        'offsets': np.array([tuple(b._offset) for b in blocks],
+                            dtype=np.float64).reshape(-1, 2),
+        'local_angles': np.array([b._local_angle for b in blocks],
+                                 dtype=np.float64),
+        'keys': np.array([getattr(b, 'key', None) or -1 for b in blocks],
+                         dtype=np.int32),
+        'bindings': np.array([BINDING_TYPES.index(getattr(b, 'binding_type',
+                                                          'toggle'))
+                              for b in blocks], dtype=np.int8),
+        'big_explosions': np.array([getattr(b, 'big_explosion', False)
+                                    for b in blocks], dtype=bool),
+        'resource_counts': np.array([getattr(b, 'resource_count', 0)
+                                     for b in blocks], dtype=np.int32),
+        'welds': np.array([(i, index[n]) for i, b in enumerate(blocks)
+                           for n in b._adjacent_blocks if index[n] > i],
+                          dtype=np.int32).reshape(-1, 2),
+        'debris': np.array([index[b] for b in DEBRIS._blocks if b in index],
+                           dtype=np.int32),
+    }
+    for name in STATE_COLUMNS:
+        arrays[name] = getattr(BLOCK_STATE, name)[ids]
+
+    # (block, ai, ai wait, shields up, turning left, firing)
+    cockpits = [(i, b.ai, b._ai_wait, b.shieldsup,
+                 _tristate(b._turning_left), _tristate(b._firing))
+                for i, b in enumerate(blocks) if isinstance(b, CockpitBlock)]
+    arrays['cockpits'] = np.array(cockpits, dtype=np.int32).reshape(-1, 6)
+    arrays['slaves'] = np.array([(row[0], index[s]) for row in cockpits
+                                 for s in blocks[row[0]].slave_blocks
+                                 if s in index],
+                                dtype=np.int32).reshape(-1, 2)
+    target = SPACE.camera_lock and SPACE.camera_lock()
+    arrays['camera'] = np.array(index.get(target, -1))
+    return arrays
+
+
+def load(filename):
+    """Adds everything saved in `filename` to the world, which is normally
+    empty. Returns the constructions.
+    """
+    with open(filename, 'rb') as f:
+        npz = np.load(f)
+        data = dict((name, npz[name]) for name in npz.files)
+    if int(data['version']) != VERSION:
+        raise ValueError("{} is a version {} snapshot, expected {}".format(
+            filename, int(data['version']), VERSION))
+    # Nothing made here is garbage, but making this many objects would set
+    # off collection after collection of everything there is so far.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        constructions = unpack(data)
+    finally:
+        if collecting:
+            gc.enable()
+
+    PROJECTILES.extend(**dict((name, data['projectile_' + name])
+                              for name in ('positions', 'velocities', 'ttls',
+                                           'damages')))
+    RESOURCES.extend(positions=data['resource_positions'],
+                     velocities=data['resource_velocities'])
+
+    if int(data['camera']) < 0:
+        # the player's cockpit was already gone when this was saved; unpack()
+        # leaves the camera alone, since a sector handing over other ships
+        # must not lose its own
+        SPACE.camera_lock = lambda: None
+    x, y, scale, target_scale = data['view'].tolist()
+    SPACE.last_pos = Vec2d(x, y)
+    SPACE.scale, SPACE.target_scale = scale, target_scale
+    SIMULATION.ticks = int(data['tick'])
+    return constructions
+
+
+def unpack(data):
+    """Adds the constructions described by the arrays from pack() to the
+    world and returns them.
+    """
+    bodies = []
+    for x, y, a, vx, vy, w, mass, moment in data['bodies'].tolist():
+        body = pymunk.Body(mass, moment)
+        body.position = x, y
+        body.angle = a
+        body.velocity = vx, vy
+        body.angular_velocity = w
+        bodies.append(body)
+
+    blocks = [BLOCK_MAP[t](Vec2d(o), bodies[n], a)
+              for t, n, o, a in zip(data['types'].tolist(),
+                                    data['block_bodies'].tolist(),
+                                    data['offsets'].tolist(),
+                                    data['local_angles'].tolist())]
+    ids = np.array([b.id for b in blocks], dtype=np.intp)
+    for name in STATE_COLUMNS:
+        getattr(BLOCK_STATE, name)[ids] = data[name]
+
+    for b, k, t, big, count in zip(blocks, data['keys'].tolist(),
+                                   data['bindings'].tolist(),
+                                   data['big_explosions'].tolist(),
+                                   data['resource_counts'].tolist()):
+        if hasattr(b, 'binding_type'):
+            b.key = k if k >= 0 else None
+            b.binding_type = BINDING_TYPES[t]
+        if big:
+            b.big_explosion = True
+        if count:
+            b.resource_count = count
+    for i, j in data['welds'].tolist():
+        blocks[i]._adjacent_blocks.append(blocks[j])
+        blocks[j]._adjacent_blocks.append(blocks[i])
+
+    for i, ai, wait, shields, turning, firing in data['cockpits'].tolist():
+        c = blocks[i]
+        c.ai = bool(ai)
+        c._ai_wait = wait
+        c.shieldsup = bool(shields)
+        c._turning_left = _from_tristate(turning)
+        c._firing = _from_tristate(firing)
+    for i, j in data['slaves'].tolist():
+        blocks[i].slave_blocks.add(blocks[j])
+    for i in data['cockpits'][:, 0].tolist():
+        blocks[i].update_controls()
+    camera = int(data['camera'])
+    if camera >= 0:
+        SPACE.camera_lock = ref(blocks[camera])
+
+    members = [[] for _ in bodies]
+    for b, n in zip(blocks, data['block_bodies'].tolist()):
+        members[n].append(b)
+    constructions = [Construction(m, body) for m, body in zip(members, bodies)]
+    SPACE.add(*(bodies + [b._shape for b in blocks]))
+    for c, lod in zip(constructions, data['lods'].tolist()):
+        c.lod = lod
+        if lod == FROZEN:
+            c.body.sleep()
+    for i in data['debris'].tolist():
+        DEBRIS.add(blocks[i])
+    return constructions
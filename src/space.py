@@ -1,18 +1,66 @@
 """Subclass of pymunk.Space so that we can keep track of additional block
 updates.
+
+The space keeps a registry of every block, and more registries indexing
+blocks by what they are (see BLOCK_INDEXES), so a system can go straight to
+the reactors or the engines without looking at anything else. It also lists
+every construction that has a body, in a fixed order, unlike `bodies`.
 """
 import pymunk
+import settings
+
+# Registries a block can be listed in besides `blocks`. Block classes name
+# the ones they belong to in their `space_indexes`.
+BLOCK_INDEXES = ('controllable_blocks', 'cockpits', 'reactors', 'engines',
+                 'shields', 'scanners')
+
+
+class Registry(object):
+    """A collection with O(1) add, discard and membership tests that can
+    still be iterated, indexed and sliced like a list. Discarding moves the
+    last item into the gap, so the order is not kept. Changing a registry
+    while iterating over it skips items; iterate over a copy instead, and
+    share it out over ticks with a scheduler.Round rather than by slicing.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def add(self, item):
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        i = self._index.pop(item, None)
+        if i is None:
+            return
+        last = self._items.pop()
+        if last is not item:
+            self._items[i] = last
+            self._index[last] = i
 
 
 class Space(pymunk.Space):
-    blocks = []
-    controller_blocks = []
-    controllable_blocks = []
-    explosions = []
-    projectiles = set()
-    resources = set()
     camera_lock = None
     last_pos = pymunk.vec2d.Vec2d(0, 0)
+    # Frames are drawn between the last two ticks: `lag` seconds before the
+    # newest state, and the camera is drawn from `view_pos`.
+    lag = 0.0
+    view_pos = pymunk.vec2d.Vec2d(0, 0)
     scale = 1
     target_scale = 1
 
@@ -20,14 +68,20 @@ class Space(pymunk.Space):
         super(Space, self).__init__()
         self.damping = 0.8
         self.iterations = 100
+        self.sleep_time_threshold = settings.SLEEP_TIME
+        self.idle_speed_threshold = settings.SLEEP_SPEED
+        self.blocks = Registry()
+        for name in BLOCK_INDEXES:
+            setattr(self, name, Registry())
+        self.constructions = Registry()
 
     def register_block(self, block):
-        self.blocks.append(block)
-        if hasattr(block, 'ai'):
-            self.controller_blocks.append(block)
-        if hasattr(block, 'key'):
-            self.controllable_blocks.append(block)
-
-    def register_explosion(self, exp):
-        self.explosions.append(exp)
+        self.blocks.add(block)
+        for name in block.space_indexes:
+            getattr(self, name).add(block)
+
+    def unregister_block(self, block):
+        self.blocks.discard(block)
+        for name in block.space_indexes:
+            getattr(self, name).discard(block)
 SPACE = Space()